@@ -0,0 +1,303 @@
+"""
+Admission control for DeepAgents chat execution.
+
+Each request first takes a token from the user's token bucket (rate limit),
+then waits in a fair in-process queue for an in-flight slot that respects both
+a per-user and a global concurrency limit. Bucket and slot state live in a
+backend: ``LocalAdmissionBackend`` for a single worker, or
+``MongoAdmissionBackend`` to share limits across workers.
+"""
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = "__global__"
+
+class AdmissionRejected(Exception):
+    """Raised when a request is rate limited or cannot get a slot in time."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+@dataclass
+class AdmissionLimits:
+    rate_per_second: float = 0.5
+    burst: int = 10
+    max_inflight_per_user: int = 3
+    max_inflight_global: int = 64
+
+class LocalAdmissionBackend:
+    """Token buckets and in-flight counters held in this process."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._inflight: Dict[str, int] = {}
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; return 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            return 0.0
+        self._buckets[key] = (tokens, now)
+        return (1 - tokens) / rate if rate > 0 else 60.0
+
+    async def try_acquire(self, user_id: str, limits: AdmissionLimits) -> Optional[Any]:
+        """Take a per-user and a global slot; return a lease for ``release``, or None."""
+        if self._inflight.get(user_id, 0) >= limits.max_inflight_per_user:
+            return None
+        if self._inflight.get(GLOBAL_KEY, 0) >= limits.max_inflight_global:
+            return None
+        self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+        self._inflight[GLOBAL_KEY] = self._inflight.get(GLOBAL_KEY, 0) + 1
+        return user_id
+
+    async def release(self, lease: Any) -> None:
+        for key in (lease, GLOBAL_KEY):
+            remaining = self._inflight.get(key, 0) - 1
+            if remaining > 0:
+                self._inflight[key] = remaining
+            else:
+                self._inflight.pop(key, None)
+
+class MongoAdmissionBackend:
+    """
+    Token buckets and in-flight slots shared through a MongoDB collection.
+
+    Every in-flight slot is its own lease document (``lease:<key>:<n>`` for
+    ``n`` below the limit) with an ``expires_at`` that the holding worker
+    renews while the call runs. A worker that dies stops renewing, so its
+    leases lapse individually after ``lease_ttl`` and are taken over (or
+    purged by the TTL index) without waiting for the whole key to go idle.
+
+    Parameters
+    ----------
+    db:
+        Motor database handle.
+    collection:
+        Collection holding bucket and lease documents.
+    lease_ttl:
+        Seconds a lease survives without renewal.
+    """
+
+    def __init__(self, db, collection: str = "admission", lease_ttl: float = 60.0) -> None:
+        self.collection = db[collection]
+        self.lease_ttl = lease_ttl
+        self.worker_id = uuid.uuid4().hex
+        self._held: Set[str] = set()
+        self._renewer: Optional[asyncio.Task] = None
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+        refilled = {"$min": [burst, {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$refilled_at", now]}]}, rate]}
+        ]}]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": f"rate:{key}"},
+            [
+                {"$set": {"tokens": refilled, "refilled_at": now, "updated_at": "$$NOW"}},
+                {"$set": {"granted": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$granted", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["granted"]:
+            return 0.0
+        return (1 - doc["tokens"]) / rate if rate > 0 else 60.0
+
+    def _expiry(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.lease_ttl)
+
+    async def _claim(self, key: str, limit: int) -> Optional[str]:
+        """Take a free or lapsed slot lease for ``key``; None if all ``limit`` are held."""
+        now = datetime.now(timezone.utc)
+        live = await self.collection.find({"key": key, "expires_at": {"$gt": now}}, {"slot": 1}).to_list(None)
+        taken = {doc["slot"] for doc in live}
+        for slot in range(limit):
+            if slot in taken:
+                continue
+            lease_id = f"lease:{key}:{slot}"
+            try:
+                await self.collection.update_one(
+                    {"_id": lease_id, "expires_at": {"$lte": now}},
+                    {"$set": {"key": key, "slot": slot, "worker": self.worker_id, "expires_at": self._expiry()}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                # Another worker holds this slot and its lease is live
+                continue
+            self._held.add(lease_id)
+            return lease_id
+        return None
+
+    async def _drop(self, lease_id: str) -> None:
+        self._held.discard(lease_id)
+        await self.collection.delete_one({"_id": lease_id, "worker": self.worker_id})
+
+    async def try_acquire(self, user_id: str, limits: AdmissionLimits) -> Optional[Any]:
+        user_lease = await self._claim(user_id, limits.max_inflight_per_user)
+        if user_lease is None:
+            return None
+        global_lease = await self._claim(GLOBAL_KEY, limits.max_inflight_global)
+        if global_lease is None:
+            await self._drop(user_lease)
+            return None
+        if self._renewer is None:
+            self._renewer = asyncio.create_task(self._renew_loop())
+        return (user_lease, global_lease)
+
+    async def release(self, lease: Any) -> None:
+        for lease_id in lease:
+            await self._drop(lease_id)
+
+    async def _renew_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            if not self._held:
+                continue
+            try:
+                await self.collection.update_many(
+                    {"_id": {"$in": list(self._held)}, "worker": self.worker_id},
+                    {"$set": {"expires_at": self._expiry()}},
+                )
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to renew admission leases: %s", exc)
+
+    async def stop(self) -> None:
+        if self._renewer is not None:
+            self._renewer.cancel()
+            await asyncio.gather(self._renewer, return_exceptions=True)
+            self._renewer = None
+
+class AdmissionController:
+    """
+    Rate limiting plus fair, bounded queueing for in-flight slots.
+
+    Waiters are served in arrival order, skipping any whose user is already at
+    their per-user limit, so one busy user cannot block everyone behind them.
+
+    Parameters
+    ----------
+    backend:
+        Local or shared state backend.
+    limits:
+        Rate and concurrency limits.
+    queue_timeout:
+        Longest a request waits for a slot before being rejected.
+    max_queue:
+        Waiters allowed in this process; beyond that requests are rejected at once.
+    retry_interval:
+        How often queued waiters re-check the backend (slots may be freed by other workers).
+    """
+
+    def __init__(
+        self,
+        backend,
+        limits: AdmissionLimits,
+        queue_timeout: float = 10.0,
+        max_queue: int = 256,
+        retry_interval: float = 0.25,
+    ) -> None:
+        self.backend = backend
+        self.limits = limits
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.retry_interval = retry_interval
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+        self._dispatching = asyncio.Lock()
+        self._ticker: Optional[asyncio.Task] = None
+
+    async def check_rate(self, user_id: str) -> None:
+        """Take a rate-limit token for ``user_id`` or raise AdmissionRejected."""
+        wait = await self.backend.take_token(user_id, self.limits.rate_per_second, self.limits.burst)
+        if wait > 0:
+            raise AdmissionRejected("Rate limit exceeded", wait)
+
+    async def _dispatch(self) -> None:
+        async with self._dispatching:
+            for entry in list(self._waiters):
+                user_id, future = entry
+                if future.done():
+                    self._waiters.remove(entry)
+                else:
+                    lease = await self.backend.try_acquire(user_id, self.limits)
+                    if lease is None:
+                        continue
+                    self._waiters.remove(entry)
+                    if future.done():
+                        # Timed out while we were acquiring; hand the slot back
+                        await self.backend.release(lease)
+                    else:
+                        future.set_result(lease)
+
+    async def _tick(self) -> None:
+        while self._waiters:
+            await asyncio.sleep(self.retry_interval)
+            await self._dispatch()
+        self._ticker = None
+
+    async def _acquire_slot(self, user_id: str, queue_timeout: Optional[float] = None) -> Any:
+        if not self._waiters:
+            lease = await self.backend.try_acquire(user_id, self.limits)
+            if lease is not None:
+                return lease
+        if len(self._waiters) >= self.max_queue:
+            raise AdmissionRejected("Too many queued requests", self.queue_timeout)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((user_id, future))
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._tick())
+        timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled():
+                # A slot was granted just as we gave up; hand it back
+                await self.backend.release(future.result())
+            else:
+                future.cancel()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise AdmissionRejected("Timed out waiting for a free slot", self.retry_interval * 4) from None
+            raise
+
+    @asynccontextmanager
+    async def hold_slot(self, user_id: str, queue_timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold an in-flight slot (no rate-limit token) for the duration of the block."""
+        lease = await self._acquire_slot(user_id, queue_timeout)
+        try:
+            yield
+        finally:
+            await self.backend.release(lease)
+            if self._waiters:
+                await self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, user_id: str) -> AsyncIterator[None]:
+        """Hold a rate-limit token and an in-flight slot for the duration of the block."""
+        await self.check_rate(user_id)
+        async with self.hold_slot(user_id):
+            yield
+
+    async def stop(self) -> None:
+        stop = getattr(self.backend, "stop", None)
+        if stop is not None:
+            await stop()
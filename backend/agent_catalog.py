@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi import Response
+from pymongo.errors import OperationFailure
+
+from models import Agent
+
+logger = logging.getLogger(__name__)
+
+class AgentCatalog:
+    """
+    In-process cache of the ``agents`` collection.
+
+    The catalog is held both as validated dicts (for lookups) and as
+    pre-serialized JSON bytes with a strong ETag (for the list endpoints).
+    It is refreshed from a MongoDB change stream when the deployment supports
+    one, otherwise every ``refresh_interval`` seconds.
+
+    Parameters
+    ----------
+    db:
+        Motor database handle.
+    refresh_interval:
+        Polling interval used when change streams are unavailable.
+    use_change_stream:
+        Set to False to always poll.
+    """
+
+    def __init__(self, db, refresh_interval: float = 300.0, use_change_stream: bool = True) -> None:
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.use_change_stream = use_change_stream
+
+        self.agents: List[Dict[str, Any]] = []
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.body: bytes = b"[]"
+        self.etag: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.etag is not None
+
+    async def refresh(self) -> None:
+        """Reload the catalog from MongoDB and rebuild the serialized payload."""
+        async with self._lock:
+            docs = await self.db.agents.find({}, {"_id": 0}).to_list(100)
+            agents = [Agent(**doc).model_dump(mode="json") for doc in docs]
+            body = json.dumps(agents, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+            self.agents = agents
+            self.by_id = {agent["id"]: agent for agent in agents}
+            self.body = body
+            self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    async def ensure_loaded(self) -> None:
+        if not self.loaded:
+            await self.refresh()
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        """Serve the cached catalog, or 304 when the client already has this version."""
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if if_none_match and (if_none_match.strip() == "*" or self.etag in [tag.strip() for tag in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Agent catalog refresh failed: %s", exc)
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                async with self.db.agents.watch() as stream:
+                    # Changes made before the stream opened would otherwise be missed
+                    await self.refresh()
+                    async for _ in stream:
+                        await self.refresh()
+            except OperationFailure as exc:
+                logger.info("Change streams unavailable (%s); polling agent catalog every %ss", exc, self.refresh_interval)
+                await self._poll()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Agent catalog change stream dropped: %s", exc)
+                await asyncio.sleep(self.refresh_interval)
+
+    async def start(self) -> None:
+        """Load the catalog and start background refreshing."""
+        try:
+            await self.refresh()
+        except Exception as exc:  # noqa: BLE001
+            logger.error("Failed to load agent catalog: %s", exc)
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch() if self.use_change_stream else self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -1,48 +1,303 @@
+import asyncio
+import logging
 import os
-from typing import Any, Dict
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 
+from circuit_breaker import CircuitOpenError
+from replica_pool import STRATEGY_LEAST_OUTSTANDING, Replica, ReplicaPool
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+def _consume_result(task: asyncio.Task) -> None:
+    # Mark a losing hedge's exception as retrieved
+    if not task.cancelled():
+        task.exception()
+
 class AgentOrchestrator:
     """Minimal proxy responsible for communicating with DeepAgents."""
 
     def __init__(self) -> None:
-        base_url = os.environ.get("DEEPAGENTS_URL", "http://108.130.44.215:8000").rstrip("/")
-        timeout_raw = os.environ.get("DEEPAGENTS_TIMEOUT", "600")
+        # DEEPAGENTS_URLS is a comma-separated replica list; DEEPAGENTS_URL a single replica
+        raw_urls = os.environ.get("DEEPAGENTS_URLS") or os.environ.get("DEEPAGENTS_URL", "http://108.130.44.215:8000")
+        base_urls = [url.strip() for url in raw_urls.split(",") if url.strip()]
 
-        try:
-            self.timeout_seconds = float(timeout_raw)
-        except ValueError:
-            self.timeout_seconds = 600.0
+        self.timeout_seconds = _env_float("DEEPAGENTS_TIMEOUT", 600.0)
+        self.connect_timeout_seconds = _env_float("DEEPAGENTS_CONNECT_TIMEOUT", 5.0)
+        self.state_timeout_seconds = _env_float("DEEPAGENTS_STATE_TIMEOUT", 15.0)
+
+        self.chat_timeout = httpx.Timeout(self.timeout_seconds, connect=self.connect_timeout_seconds)
+        self.state_timeout = httpx.Timeout(self.state_timeout_seconds, connect=self.connect_timeout_seconds)
+
+        self.limits = httpx.Limits(
+            max_connections=_env_int("DEEPAGENTS_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int("DEEPAGENTS_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("DEEPAGENTS_KEEPALIVE_EXPIRY", 30.0),
+        )
+        self.http2 = _env_flag("DEEPAGENTS_HTTP2")
+
+        self._client: Optional[httpx.AsyncClient] = None
 
-        self.chat_url = f"{base_url}/api/v1/chat"
-        self.state_url = f"{base_url}/api/v1/state"
+        # Single-flight + micro-cache for state polls, keyed by thread_id
+        self.state_cache_ttl = _env_float("DEEPAGENTS_STATE_CACHE_TTL", 1.0)
+        self._state_inflight: Dict[str, asyncio.Task] = {}
+        self._state_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
 
-    async def send_chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Per replica and endpoint: rolling error rate, latency percentiles, circuit breaker
+        breaker_options = dict(
+            window_seconds=_env_float("DEEPAGENTS_BREAKER_WINDOW", 60.0),
+            min_calls=_env_int("DEEPAGENTS_BREAKER_MIN_CALLS", 10),
+            error_threshold=_env_float("DEEPAGENTS_BREAKER_ERROR_RATE", 0.5),
+            open_seconds=_env_float("DEEPAGENTS_BREAKER_OPEN_SECONDS", 30.0),
+        )
+        self.pool = ReplicaPool(
+            base_urls,
+            breaker_options,
+            strategy=os.environ.get("DEEPAGENTS_LB_STRATEGY", STRATEGY_LEAST_OUTSTANDING),
+            vnodes=_env_int("DEEPAGENTS_RING_VNODES", 100),
+            ewma_alpha=_env_float("DEEPAGENTS_EWMA_ALPHA", 0.3),
+            health_path=os.environ.get("DEEPAGENTS_HEALTH_PATH", "/health"),
+            health_interval=_env_float("DEEPAGENTS_HEALTH_INTERVAL", 10.0),
+        )
+        # Replicas share thread state (e.g. a common checkpointer): enables hedged state
+        # reads and chat failover for existing threads
+        self.hedge_state = _env_flag("DEEPAGENTS_HEDGE_STATE")
+        self.hedge_default_delay = _env_float("DEEPAGENTS_HEDGE_DELAY", 0.5)
+        self.hedge_min_delay = _env_float("DEEPAGENTS_HEDGE_MIN_DELAY", 0.05)
+        # State read timeout = clamp(p99 * multiplier, min, DEEPAGENTS_STATE_TIMEOUT)
+        self.state_timeout_multiplier = _env_float("DEEPAGENTS_STATE_TIMEOUT_MULTIPLIER", 3.0)
+        self.state_timeout_min_seconds = _env_float("DEEPAGENTS_STATE_TIMEOUT_MIN", 2.0)
+        # Last good state per thread, served while the state circuit is open
+        self._stale_states: TTLCache = TTLCache(maxsize=4096, ttl=_env_float("DEEPAGENTS_STALE_STATE_TTL", 300.0))
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("DEEPAGENTS_HTTP2 is set but the 'h2' package is missing; using HTTP/1.1")
+                http2 = False
+
+        return httpx.AsyncClient(timeout=self.chat_timeout, limits=self.limits, http2=http2)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled client; created lazily if ``startup`` was not called."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def startup(self) -> None:
+        """Open the pooled HTTP client and start replica health checks. Called from the FastAPI startup hook."""
+        _ = self.client
+        self.pool.start(lambda: self.client)
+
+    async def shutdown(self) -> None:
+        """Stop health checks, close the pooled HTTP client and drop idle keep-alive connections."""
+        await self.pool.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def new_thread_id(self) -> str:
+        """Thread id for a new conversation, owned by the least loaded replica."""
+        return self.pool.new_thread_id()
+
+    async def send_chat(self, payload: Dict[str, Any], new_thread: bool = False) -> Dict[str, Any]:
         """
         Forward chat payloads to DeepAgents and return the JSON response.
 
+        The request goes to the replica owning ``thread_id`` on the hash ring. If
+        that replica's circuit is open or it refuses the connection, the next
+        replica on the ring is tried (the request was never sent), but only
+        when no replica holds state for the thread yet (``new_thread``) or the
+        replicas share thread state (``DEEPAGENTS_HEDGE_STATE``). Otherwise a
+        follow-up would silently run without its conversation context.
+
         Parameters
         ----------
         payload:
             Dict containing the DeepAgents fields (user_query, agent_name, thread_id).
+        new_thread:
+            True if this is the thread's first message.
         """
-        async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
-            response = await client.post(self.chat_url, json=payload)
+        thread_id = payload.get("thread_id")
+        if not thread_id:
+            candidates = self.pool.by_load("chat")
+        elif new_thread or self.hedge_state:
+            candidates = self.pool.for_thread(thread_id, "chat")
+        else:
+            candidates = [self.pool.owner(thread_id)]
+        response = await self._first_reachable(candidates, "chat", "POST", "", self.chat_timeout, json=payload)
+        return response.json()
+
+    async def _first_reachable(
+        self, candidates: List[Replica], endpoint: str, method: str, path: str, timeout: httpx.Timeout, **kwargs: Any
+    ) -> httpx.Response:
+        error: Optional[Exception] = None
+        for replica in candidates:
+            url = f"{replica.chat_url if endpoint == 'chat' else replica.state_url}{path}"
+            try:
+                return await self._request(replica, endpoint, method, url, timeout, **kwargs)
+            except (CircuitOpenError, httpx.ConnectError) as exc:
+                error = exc
+        raise error
+
+    async def _request(
+        self, replica: Replica, endpoint: str, method: str, url: str, timeout: httpx.Timeout, **kwargs: Any
+    ) -> httpx.Response:
+        """Issue a request through the replica endpoint's circuit breaker, recording its outcome."""
+        health = replica.health[endpoint]
+        probe = health.before_call()
+
+        replica.outstanding += 1
+        started = time.monotonic()
+        success: Optional[bool] = None
+        try:
+            response = await self.client.request(method, url, timeout=timeout, **kwargs)
             response.raise_for_status()
-            return response.json()
+            success = True
+            return response
+        except httpx.HTTPStatusError as exc:
+            # 4xx is a caller problem, not an upstream health signal
+            success = exc.response.status_code < 500
+            raise
+        except httpx.HTTPError:
+            success = False
+            raise
+        finally:
+            replica.outstanding -= 1
+            latency = time.monotonic() - started
+            if success is None:
+                health.abandon(probe)
+            else:
+                health.record(success, latency, probe)
+                if success:
+                    replica.observe(latency)
+
+    def current_state_timeout(self, replica: Optional[Replica] = None) -> httpx.Timeout:
+        """State-call timeout derived from observed p99 latency, capped at DEEPAGENTS_STATE_TIMEOUT."""
+        p99 = (replica or self.pool.replicas[0]).health["state"].latency_percentile(99)
+        if p99 is None:
+            return self.state_timeout
+        read = min(self.state_timeout_seconds, max(self.state_timeout_min_seconds, p99 * self.state_timeout_multiplier))
+        return httpx.Timeout(read, connect=self.connect_timeout_seconds)
+
+    def hedge_delay(self, replica: Replica) -> float:
+        """Wait this long for ``replica`` before hedging: its state p95, or the configured default."""
+        p95 = replica.health["state"].latency_percentile(95)
+        return max(self.hedge_min_delay, p95) if p95 is not None else self.hedge_default_delay
+
+    async def _hedged_state(self, thread_id: str, primary: Replica) -> httpx.Response:
+        """Ask the owner; if it has not answered after the hedge delay (or failed), also ask the least loaded other replica."""
+        def attempt(replica: Replica) -> asyncio.Task:
+            task = asyncio.create_task(self._request(
+                replica, "state", "GET", f"{replica.state_url}/{thread_id}", self.current_state_timeout(replica)
+            ))
+            task.add_done_callback(_consume_result)
+            return task
+
+        tasks = [attempt(primary)]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+            if not done or tasks[0].exception() is not None:
+                tasks.append(attempt(self.pool.by_load("state", exclude=[primary])[0]))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_state(self, thread_id: str) -> Dict[str, Any]:
+        candidates = self.pool.for_thread(thread_id, "state")
+        if self.hedge_state and len(candidates) > 1:
+            response = await self._hedged_state(thread_id, candidates[0])
+        else:
+            response = await self._first_reachable(candidates, "state", "GET", f"/{thread_id}", self.current_state_timeout(candidates[0]))
+        state = response.json()
+        if self.state_cache_ttl > 0:
+            self._state_cache[thread_id] = (time.monotonic() + self.state_cache_ttl, state)
+        self._stale_states.set(thread_id, state)
+        return state
+
+    def _prune_state_cache(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._state_cache.items() if expires_at <= now]
+        for key in expired:
+            del self._state_cache[key]
+
+    def _finish_state_fetch(self, thread_id: str, task: asyncio.Task) -> None:
+        self._state_inflight.pop(thread_id, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
 
     async def get_state(self, thread_id: str) -> Dict[str, Any]:
         """
         Fetch the latest state for a DeepAgents thread.
 
+        Concurrent callers for the same thread share one upstream request, and
+        results are reused for ``DEEPAGENTS_STATE_CACHE_TTL`` seconds (0 disables).
+        While the state circuit is open the last good state is returned with
+        ``stale: True``; without one, ``CircuitOpenError`` is raised.
+
         Parameters
         ----------
         thread_id:
             The persistent identifier used in previous chat invocations.
         """
-        url = f"{self.state_url}/{thread_id}"
-        async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
+        cached = self._state_cache.get(thread_id)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                return cached[1]
+            del self._state_cache[thread_id]
+
+        task = self._state_inflight.get(thread_id)
+        if task is None:
+            if len(self._state_cache) > 1024:
+                self._prune_state_cache()
+            task = asyncio.create_task(self._fetch_state(thread_id))
+            self._state_inflight[thread_id] = task
+            task.add_done_callback(lambda done: self._finish_state_fetch(thread_id, done))
+
+        # Shield so one caller disconnecting does not cancel the shared request
+        try:
+            return await asyncio.shield(task)
+        except CircuitOpenError:
+            stale = self._stale_states.get(thread_id)
+            if stale is None:
+                raise
+            return {**stale, "stale": True}
+
+    def health_snapshot(self) -> Dict[str, Any]:
+        return {**self.pool.snapshot(), "hedge_state": self.hedge_state}
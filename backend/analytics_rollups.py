@@ -0,0 +1,100 @@
+"""
+Incrementally maintained analytics rollups.
+
+Every recorded AnalyticsEntry bumps three documents in ``analytics_rollups``
+with ``$inc``: the user's totals, the user's totals for that agent, and the
+user's totals for that UTC day. ``/api/analytics`` reads these instead of
+aggregating the raw entries.
+"""
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "analytics_rollups"
+
+SCOPE_USER = "user"
+SCOPE_AGENT = "agent"
+SCOPE_DAY = "day"
+
+# Fields identifying a rollup document of each scope, in key order
+SCOPE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    SCOPE_USER: ("user_id",),
+    SCOPE_AGENT: ("user_id", "agent_name"),
+    SCOPE_DAY: ("user_id", "day"),
+}
+
+def key_parts(scope: str, values: Sequence[Any]) -> List[Any]:
+    """
+    Parts of a rollup ``key``: ``scope:value:value``. Incremental updates join
+    them as strings and the rebuild ``$concat``s them as expressions, so both
+    always produce the same key.
+    """
+    parts: List[Any] = [scope]
+    for value in values:
+        parts += [":", value]
+    return parts
+
+def rollup_key(scope: str, fields: Dict[str, Any]) -> str:
+    return "".join(str(part) for part in key_parts(scope, [fields[name] for name in SCOPE_FIELDS[scope]]))
+
+def rollup_updates(entry: Dict[str, Any]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(filter, update) pairs applying one analytics entry to its rollup documents."""
+    timestamp = entry["timestamp"]
+    day = timestamp[:10] if isinstance(timestamp, str) else timestamp.strftime("%Y-%m-%d")
+    increments = {
+        "queries": 1,
+        "cost": entry.get("cost", 0.0),
+        "tokens_used": entry.get("tokens_used", 0),
+    }
+    values = {"user_id": entry["user_id"], "agent_name": entry["agent_name"], "day": day}
+
+    updates = []
+    for scope, field_names in SCOPE_FIELDS.items():
+        fields = {name: values[name] for name in field_names}
+        updates.append((
+            {"key": rollup_key(scope, fields)},
+            {"$inc": increments, "$setOnInsert": {**fields, "scope": scope}},
+        ))
+    return updates
+
+def _day_expression() -> Dict[str, Any]:
+    return {"$cond": [
+        {"$eq": [{"$type": "$timestamp"}, "date"]},
+        {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+        {"$substrCP": ["$timestamp", 0, 10]},
+    ]}
+
+async def rebuild_rollups(db) -> int:
+    """Recompute every rollup document from the raw analytics entries."""
+    sums = {
+        "queries": {"$sum": 1},
+        "cost": {"$sum": "$cost"},
+        "tokens_used": {"$sum": {"$ifNull": ["$tokens_used", 0]}},
+    }
+    group_expressions = {"user_id": "$user_id", "agent_name": "$agent_name", "day": _day_expression()}
+
+    await db[COLLECTION].delete_many({})
+    for scope, field_names in SCOPE_FIELDS.items():
+        group_id = {name: group_expressions[name] for name in field_names}
+        key_expr = key_parts(scope, [{"$toString": {"$ifNull": [f"$_id.{name}", ""]}} for name in field_names])
+        projection = {
+            "_id": 0,
+            "key": {"$concat": key_expr},
+            "scope": {"$literal": scope},
+            "queries": 1,
+            "cost": 1,
+            "tokens_used": 1,
+        }
+        for field in group_id:
+            projection[field] = f"$_id.{field}"
+        pipeline = [
+            {"$group": {"_id": group_id, **sums}},
+            {"$project": projection},
+            {"$merge": {"into": COLLECTION, "on": "key", "whenMatched": "replace"}},
+        ]
+        await db.analytics.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+    count = await db[COLLECTION].count_documents({})
+    logger.info("Rebuilt %d analytics rollup documents", count)
+    return count
@@ -0,0 +1,258 @@
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# Worker bookkeeping kept out of API responses
+INTERNAL_FIELDS_HIDDEN = {"_id": 0, "owner": 0, "heartbeat_at": 0, "attempts": 0}
+
+JobRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+JobAdmission = Callable[[Dict[str, Any]], AsyncContextManager[Any]]
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued on this worker."""
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _ago(seconds: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class ChatJobManager:
+    """
+    Runs chat jobs as background tasks with bounded concurrency.
+
+    Job documents live in the ``chat_jobs`` collection. Status transitions are
+    conditional updates (queued -> running -> completed/failed), so a job that
+    was cancelled from another worker is never overwritten with a result.
+
+    Every active job records the worker that owns it and a ``heartbeat_at``
+    refreshed while the worker is alive. Jobs whose heartbeat goes stale (the
+    worker was killed) are reclaimed by a live worker and run again, up to
+    ``max_attempts`` runs, then failed. A graceful shutdown puts its jobs back
+    in ``queued`` without an owner so another worker picks them up.
+
+    Parameters
+    ----------
+    db:
+        Motor database handle.
+    runner:
+        Coroutine executing a job document and returning the result to store.
+    max_concurrency:
+        Jobs executing at once on this worker; the rest wait in ``queued``.
+    max_queued:
+        Jobs accepted (queued + running) on this worker before ``submit`` refuses.
+    worker_id:
+        Owner recorded on this worker's jobs (defaults to host, pid and a random suffix).
+    heartbeat_interval:
+        Seconds between heartbeats and sweeps for stale jobs.
+    stale_after:
+        Seconds without a heartbeat after which an active job is reclaimed.
+    max_attempts:
+        Runs a job gets before a stale one is failed instead of reclaimed.
+    admit:
+        Optional context manager factory that must let a job in (e.g. a per-user
+        in-flight slot) before it takes an execution permit. While it refuses,
+        the job stays ``queued`` and is retried every ``admission_retry`` seconds.
+    admission_retry:
+        Seconds to wait before asking ``admit`` again after a refusal.
+    """
+
+    def __init__(
+        self,
+        db,
+        runner: JobRunner,
+        max_concurrency: int = 8,
+        max_queued: int = 100,
+        worker_id: Optional[str] = None,
+        heartbeat_interval: float = 15.0,
+        stale_after: float = 60.0,
+        max_attempts: int = 2,
+        admit: Optional[JobAdmission] = None,
+        admission_retry: float = 5.0,
+    ) -> None:
+        self.db = db
+        self.runner = runner
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.admit = admit
+        self.admission_retry = admission_retry
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._shutting_down = False
+
+    async def _set_status(self, job_id: str, expected: Any, status: str, owned: bool = False, **fields: Any) -> bool:
+        current = {"$in": list(expected)} if isinstance(expected, tuple) else expected
+        query = {"id": job_id, "status": current}
+        if owned:
+            # A job reclaimed by another worker is no longer ours to finish
+            query["owner"] = self.worker_id
+        result = await self.db.chat_jobs.update_one(query, {"$set": {"status": status, **fields}})
+        return result.modified_count == 1
+
+    def _schedule(self, job: Dict[str, Any]) -> None:
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+
+    async def submit(self, job: Dict[str, Any]) -> None:
+        """Persist ``job`` as queued and schedule it."""
+        if len(self._tasks) >= self.max_queued:
+            raise JobQueueFull()
+        now = _now()
+        job.update({"status": STATUS_QUEUED, "created_at": now, "owner": self.worker_id, "heartbeat_at": now, "attempts": 0})
+        await self.db.chat_jobs.insert_one(dict(job))
+        self._schedule(job)
+
+    async def _enter_admission(self, stack: contextlib.AsyncExitStack, job: Dict[str, Any]) -> None:
+        while True:
+            try:
+                await stack.enter_async_context(self.admit(job))
+                return
+            except Exception as exc:  # noqa: BLE001
+                logger.info("Chat job %s not admitted yet (%s); retrying in %ss", job["id"], exc, self.admission_retry)
+                await asyncio.sleep(self.admission_retry)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                # Admission comes first so a job waiting on its user's limit holds no execution permit
+                if self.admit is not None:
+                    await self._enter_admission(stack, job)
+                async with self._semaphore:
+                    result = await self.db.chat_jobs.update_one(
+                        {"id": job_id, "status": STATUS_QUEUED, "owner": self.worker_id},
+                        {"$set": {"status": STATUS_RUNNING, "started_at": _now(), "heartbeat_at": _now()}, "$inc": {"attempts": 1}},
+                    )
+                    if result.modified_count != 1:
+                        return
+                    result = await self.runner(job)
+            await self._set_status(job_id, STATUS_RUNNING, STATUS_COMPLETED, owned=True, finished_at=_now(), result=result)
+        except asyncio.CancelledError:
+            if self._shutting_down:
+                # Leave it for another worker rather than losing it
+                await self._set_status(job_id, ACTIVE_STATUSES, STATUS_QUEUED, owned=True, owner=None, heartbeat_at=None)
+            else:
+                await self._set_status(job_id, ACTIVE_STATUSES, STATUS_CANCELLED, owned=True, finished_at=_now())
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.error("Chat job %s failed: %s", job_id, exc)
+            detail = getattr(exc, "detail", None) or str(exc) or exc.__class__.__name__
+            await self._set_status(job_id, STATUS_RUNNING, STATUS_FAILED, owned=True, finished_at=_now(), error=detail)
+
+    async def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """The job as shown to its user (without the worker bookkeeping fields)."""
+        return await self.db.chat_jobs.find_one({"id": job_id, "user_id": user_id}, INTERNAL_FIELDS_HIDDEN)
+
+    async def cancel(self, job_id: str, user_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it already finished."""
+        job = await self.get(job_id, user_id)
+        if not job or job["status"] not in ACTIVE_STATUSES:
+            return False
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return True
+        # Owned by another worker: its final conditional update will not match
+        return await self._set_status(job_id, ACTIVE_STATUSES, STATUS_CANCELLED, finished_at=_now())
+
+    async def beat(self) -> None:
+        """
+        Refresh ``heartbeat_at`` on every job this worker holds, and stop local
+        tasks whose job was cancelled (or reclaimed) through another worker.
+        """
+        if not self._tasks:
+            return
+        job_ids = list(self._tasks)
+        docs = await self.db.chat_jobs.find({"id": {"$in": job_ids}}, {"_id": 0, "id": 1, "status": 1, "owner": 1}).to_list(None)
+        for doc in docs:
+            if doc["status"] not in ACTIVE_STATUSES or doc.get("owner") != self.worker_id:
+                task = self._tasks.get(doc["id"])
+                if task is not None:
+                    logger.info("Stopping chat job %s: it is %s elsewhere", doc["id"], doc["status"])
+                    task.cancel()
+        await self.db.chat_jobs.update_many(
+            {"id": {"$in": job_ids}, "owner": self.worker_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"$set": {"heartbeat_at": _now()}},
+        )
+
+    async def reclaim(self) -> int:
+        """
+        Take over active jobs whose owner stopped heartbeating (or that a
+        shutdown released). Jobs out of attempts are failed. Returns the
+        number of jobs scheduled here.
+        """
+        stale = {
+            "status": {"$in": list(ACTIVE_STATUSES)},
+            "$or": [{"owner": None}, {"heartbeat_at": {"$lt": _ago(self.stale_after)}}],
+        }
+        claimed = 0
+        cursor = self.db.chat_jobs.find(stale, {"_id": 0})
+        async for job in cursor:
+            if len(self._tasks) >= self.max_queued:
+                break
+            # Conditional on the values we read, so only one worker wins each job
+            match = {"id": job["id"], "status": job["status"], "owner": job.get("owner"), "heartbeat_at": job.get("heartbeat_at")}
+            if job.get("attempts", 0) >= self.max_attempts:
+                await self.db.chat_jobs.update_one(match, {"$set": {
+                    "status": STATUS_FAILED, "finished_at": _now(), "error": "Worker stopped while running the job",
+                }})
+                continue
+            result = await self.db.chat_jobs.update_one(match, {"$set": {
+                "status": STATUS_QUEUED, "owner": self.worker_id, "heartbeat_at": _now(),
+            }})
+            if result.modified_count == 1:
+                logger.warning("Reclaimed chat job %s from %s", job["id"], job.get("owner") or "a stopped worker")
+                self._schedule({**job, "status": STATUS_QUEUED, "owner": self.worker_id})
+                claimed += 1
+        return claimed
+
+    async def _maintain(self) -> None:
+        while True:
+            try:
+                await self.beat()
+                await self.reclaim()
+            except Exception as exc:  # noqa: BLE001
+                logger.error("Chat job heartbeat failed: %s", exc)
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def start(self) -> None:
+        """Start heartbeating this worker's jobs and sweeping for stale ones."""
+        if self._heartbeat is None and self.heartbeat_interval > 0:
+            self._heartbeat = asyncio.create_task(self._maintain())
+
+    async def shutdown(self) -> None:
+        """Stop jobs running on this worker and release them back to ``queued``."""
+        self._shutting_down = True
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
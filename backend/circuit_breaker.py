@@ -0,0 +1,148 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream endpoint whose circuit is open."""
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        super().__init__(f"Circuit open for DeepAgents {endpoint}; retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+class EndpointHealth:
+    """
+    Rolling error rate, latency percentiles and a circuit breaker for one endpoint.
+
+    The circuit opens when at least ``min_calls`` calls in the last
+    ``window_seconds`` failed at a rate of ``error_threshold`` or more. After
+    ``open_seconds`` a single probe call is let through (half-open); its
+    outcome closes the circuit again or re-opens it. ``before_call`` hands the
+    probe a token, and only a ``record``/``abandon`` carrying that token
+    resolves the probe, so stragglers and losing hedges cannot.
+
+    Parameters
+    ----------
+    name:
+        Endpoint label used in errors and snapshots.
+    window_size:
+        Maximum number of recent calls kept for statistics.
+    window_seconds:
+        Only calls newer than this count towards the error rate.
+    min_calls:
+        Minimum calls in the window before the circuit may open.
+    error_threshold:
+        Failure ratio (0-1) that opens the circuit.
+    open_seconds:
+        How long the circuit stays open before probing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 200,
+        window_seconds: float = 60.0,
+        min_calls: int = 10,
+        error_threshold: float = 0.5,
+        open_seconds: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.open_seconds = open_seconds
+
+        self._calls: Deque[Tuple[float, bool, float]] = deque(maxlen=window_size)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe: Optional[int] = None
+        self._probe_seq = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            return STATE_HALF_OPEN
+        return self._state
+
+    def before_call(self) -> Optional[int]:
+        """
+        Raise CircuitOpenError unless a call may go upstream right now.
+
+        Returns the probe token when this call is the half-open probe, else None.
+        """
+        state = self.state
+        if state == STATE_CLOSED:
+            return None
+        if state == STATE_HALF_OPEN and self._probe is None:
+            self._probe_seq += 1
+            self._probe = self._probe_seq
+            return self._probe
+        retry_after = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(self.name, retry_after or 1.0)
+
+    def record(self, success: bool, latency: float, probe: Optional[int] = None) -> None:
+        """Record a finished call (latency in seconds) and update the circuit."""
+        now = time.monotonic()
+        self._calls.append((now, success, latency))
+
+        if probe is not None and probe == self._probe:
+            self._probe = None
+            if success:
+                self._state = STATE_CLOSED
+                self._calls.clear()
+                self._calls.append((now, success, latency))
+            else:
+                self._open(now)
+            return
+
+        if self._state == STATE_CLOSED:
+            recent = self._recent(now)
+            if len(recent) >= self.min_calls:
+                failures = sum(1 for _, ok, _ in recent if not ok)
+                if failures / len(recent) >= self.error_threshold:
+                    self._open(now)
+
+    def abandon(self, probe: Optional[int] = None) -> None:
+        """A call ended without an outcome (e.g. cancelled); free the probe slot if it held it."""
+        if probe is not None and probe == self._probe:
+            self._probe = None
+
+    def _open(self, now: float) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = now
+
+    def _recent(self, now: Optional[float] = None):
+        cutoff = (now or time.monotonic()) - self.window_seconds
+        return [call for call in self._calls if call[0] >= cutoff]
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile (seconds) of successful calls in the window."""
+        latencies = sorted(latency for _, ok, latency in self._recent() if ok)
+        if len(latencies) < self.min_calls:
+            return None
+        index = min(len(latencies) - 1, int(round(pct / 100.0 * len(latencies))) - 1)
+        return latencies[max(0, index)]
+
+    def error_rate(self) -> float:
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        return sum(1 for _, ok, _ in recent if not ok) / len(recent)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "calls": len(self._recent()),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": self._ms(self.latency_percentile(50)),
+            "p95_ms": self._ms(self.latency_percentile(95)),
+            "p99_ms": self._ms(self.latency_percentile(99)),
+        }
+
+    @staticmethod
+    def _ms(seconds: Optional[float]) -> Optional[float]:
+        return round(seconds * 1000, 1) if seconds is not None else None
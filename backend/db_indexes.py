@@ -0,0 +1,135 @@
+"""
+Declarative MongoDB index registry.
+
+Indexes are ensured idempotently from the FastAPI startup hook, and the module
+doubles as a standalone migration command:
+
+    python db_indexes.py           # create missing indexes
+    python db_indexes.py --check   # report drift only, exit 1 if missing or mismatched
+"""
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return "_".join(f"{key}_{direction}" for key, direction in self.keys)
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("user_sessions", (("session_token", ASCENDING),), unique=True),
+    # TTL: MongoDB purges sessions once expires_at (a BSON date) has passed
+    IndexSpec("user_sessions", (("expires_at", ASCENDING),), options={"expireAfterSeconds": 0}),
+    IndexSpec("users", (("id", ASCENDING),), unique=True),
+    IndexSpec("users", (("email", ASCENDING),), unique=True),
+    IndexSpec("user_credits", (("user_id", ASCENDING),), unique=True),
+    IndexSpec("agents", (("id", ASCENDING),), unique=True),
+    IndexSpec("user_agents", (("user_id", ASCENDING), ("agent_id", ASCENDING)), unique=True),
+    IndexSpec("chat_history", (("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING))),
+    IndexSpec("chat_history", (("thread_id", ASCENDING), ("user_id", ASCENDING))),
+    IndexSpec("threads", (("thread_id", ASCENDING), ("user_id", ASCENDING)), unique=True),
+    IndexSpec("threads", (("user_id", ASCENDING), ("last_activity", DESCENDING), ("thread_id", DESCENDING))),
+    IndexSpec("chat_jobs", (("id", ASCENDING), ("user_id", ASCENDING)), unique=True),
+    # Sweep for active jobs whose worker stopped heartbeating
+    IndexSpec("chat_jobs", (("status", ASCENDING), ("heartbeat_at", ASCENDING))),
+    IndexSpec("analytics", (("user_id", ASCENDING), ("timestamp", DESCENDING))),
+    IndexSpec("analytics_rollups", (("key", ASCENDING),), unique=True),
+    IndexSpec("analytics_rollups", (("user_id", ASCENDING), ("scope", ASCENDING), ("day", ASCENDING))),
+    IndexSpec("response_cache", (("key", ASCENDING),), unique=True),
+    IndexSpec("response_cache", (("expires_at", ASCENDING),), options={"expireAfterSeconds": 0}),
+    # Idle rate-limit buckets are dropped; slot leases are purged once they lapse unrenewed
+    IndexSpec("admission", (("updated_at", ASCENDING),), options={"expireAfterSeconds": 900}),
+    IndexSpec("admission", (("expires_at", ASCENDING),), options={"expireAfterSeconds": 0}),
+    IndexSpec("admission", (("key", ASCENDING), ("expires_at", ASCENDING))),
+    IndexSpec("waitlist", (("email", ASCENDING),), unique=True),
+    IndexSpec("waitlist", (("timestamp", DESCENDING),)),
+]
+
+def _matches(spec: IndexSpec, info: Dict[str, Any]) -> bool:
+    keys = tuple((key, int(direction)) for key, direction in info.get("key", []))
+    if keys != spec.keys or bool(info.get("unique", False)) != spec.unique:
+        return False
+    return all(info.get(option) == value for option, value in spec.options.items())
+
+async def index_drift(db, registry: List[IndexSpec] = INDEXES) -> Dict[str, List[str]]:
+    """
+    Compare live indexes with the registry.
+
+    Returns a dict with ``missing`` (not created yet), ``mismatched`` (same name,
+    different keys/options) and ``unexpected`` (live but not registered) entries,
+    each formatted as ``collection.index_name``.
+    """
+    drift: Dict[str, List[str]] = {"missing": [], "mismatched": [], "unexpected": []}
+    collections = sorted({spec.collection for spec in registry})
+
+    for collection in collections:
+        live = await db[collection].index_information()
+        expected = {spec.name: spec for spec in registry if spec.collection == collection}
+
+        for name, spec in expected.items():
+            if name not in live:
+                drift["missing"].append(f"{collection}.{name}")
+            elif not _matches(spec, live[name]):
+                drift["mismatched"].append(f"{collection}.{name}")
+
+        for name in live:
+            if name != "_id_" and name not in expected:
+                drift["unexpected"].append(f"{collection}.{name}")
+
+    return drift
+
+async def ensure_indexes(db, registry: List[IndexSpec] = INDEXES) -> Dict[str, List[str]]:
+    """
+    Create every registered index that does not exist yet and return the drift
+    left afterwards. Failures (e.g. duplicate keys blocking a unique index) are
+    logged instead of raised so a bad index never blocks startup.
+    """
+    for spec in registry:
+        try:
+            await db[spec.collection].create_index(
+                list(spec.keys), name=spec.name, unique=spec.unique, **spec.options
+            )
+        except OperationFailure as exc:
+            logger.error("Could not ensure index %s.%s: %s", spec.collection, spec.name, exc)
+
+    drift = await index_drift(db, registry)
+    for kind, entries in drift.items():
+        if entries:
+            logger.warning("Index drift (%s): %s", kind, ", ".join(entries))
+    return drift
+
+async def _main(check_only: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        drift = await (index_drift(db) if check_only else ensure_indexes(db))
+    finally:
+        client.close()
+
+    for kind, entries in drift.items():
+        for entry in entries:
+            print(f"{kind}: {entry}")
+    return 1 if drift["missing"] or drift["mismatched"] else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main("--check" in sys.argv[1:])))
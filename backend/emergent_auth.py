@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+EMERGENT_SESSION_DATA_URL = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+
+class InvalidSessionError(Exception):
+    """Raised when Emergent Auth rejects the session id."""
+
+class EmergentAuthClient:
+    """Pooled, non-blocking client for the Emergent Auth session-data exchange."""
+
+    def __init__(self) -> None:
+        self.url = os.environ.get("EMERGENT_AUTH_URL", EMERGENT_SESSION_DATA_URL)
+        self.timeout = httpx.Timeout(
+            float(os.environ.get("EMERGENT_AUTH_TIMEOUT", "10")),
+            connect=float(os.environ.get("EMERGENT_AUTH_CONNECT_TIMEOUT", "3")),
+        )
+        self.max_retries = int(os.environ.get("EMERGENT_AUTH_MAX_RETRIES", "2"))
+        self.backoff_seconds = float(os.environ.get("EMERGENT_AUTH_BACKOFF", "0.25"))
+        self.max_concurrency = int(os.environ.get("EMERGENT_AUTH_MAX_CONCURRENCY", "20"))
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency),
+            )
+        return self._client
+
+    async def startup(self) -> None:
+        _ = self.client
+
+    async def shutdown(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch_session_data(self, session_id: str) -> Dict[str, Any]:
+        """
+        Exchange an Emergent session id for the user's session data.
+
+        Transport errors, 429 and 5xx responses are retried with exponential
+        backoff; any other non-200 status raises ``InvalidSessionError``. At most
+        ``EMERGENT_AUTH_MAX_CONCURRENCY`` exchanges run at once per worker.
+        """
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                try:
+                    response = await self.client.get(self.url, headers={"X-Session-ID": session_id})
+                    if response.status_code == 429 or response.status_code >= 500:
+                        response.raise_for_status()
+                except httpx.HTTPError as exc:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.backoff_seconds * (2 ** attempt)
+                    logger.warning("Emergent auth attempt %d failed (%s); retrying in %.2fs", attempt + 1, exc, delay)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                if response.status_code != 200:
+                    raise InvalidSessionError(response.status_code)
+                return response.json()
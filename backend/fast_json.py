@@ -0,0 +1,34 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+def _default(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def dumps(content: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for large, already-trusted payloads.
+
+    Return it directly from an endpoint to skip both ``response_model``
+    validation and ``jsonable_encoder``; the content is serialized in a single
+    pass (orjson if available, otherwise the stdlib encoder).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
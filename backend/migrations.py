@@ -0,0 +1,110 @@
+"""
+One-off data migrations.
+
+    python migrations.py <name>
+
+Each migration is idempotent and safe to re-run.
+"""
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict
+
+from pymongo import UpdateOne
+
+from analytics_rollups import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+def _parse_iso(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+async def backfill_session_dates(db) -> int:
+    """Convert legacy ISO-string session timestamps to BSON dates so the TTL index applies."""
+    converted = 0
+    operations = []
+    cursor = db.user_sessions.find(
+        {"$or": [{"expires_at": {"$type": "string"}}, {"created_at": {"$type": "string"}}]},
+        {"_id": 1, "expires_at": 1, "created_at": 1},
+    )
+    async for doc in cursor:
+        update = {
+            field: _parse_iso(doc[field])
+            for field in ("expires_at", "created_at")
+            if isinstance(doc.get(field), str)
+        }
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        if len(operations) >= BATCH_SIZE:
+            await db.user_sessions.bulk_write(operations, ordered=False)
+            converted += len(operations)
+            operations = []
+
+    if operations:
+        await db.user_sessions.bulk_write(operations, ordered=False)
+        converted += len(operations)
+
+    logger.info("Converted %d session documents to BSON dates", converted)
+    return converted
+
+async def rebuild_threads(db) -> int:
+    """Recompute the threads index from chat_history."""
+    pipeline = [
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "thread_id": "$thread_id"},
+            "title": {"$first": "$query"},
+            "created_at": {"$first": "$timestamp"},
+            "last_activity": {"$last": "$timestamp"},
+            "last_agent": {"$last": "$response.agent_name"},
+            "message_count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "thread_id": "$_id.thread_id",
+            "title": {"$substrCP": ["$title", 0, 80]},
+            "created_at": 1,
+            "last_activity": 1,
+            "last_agent": 1,
+            "message_count": 1,
+        }},
+        {"$merge": {"into": "threads", "on": ["thread_id", "user_id"], "whenMatched": "replace"}},
+    ]
+    await db.chat_history.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    count = await db.threads.count_documents({})
+    logger.info("Rebuilt %d thread index entries", count)
+    return count
+
+MIGRATIONS: Dict[str, Callable[..., Awaitable[int]]] = {
+    "backfill_session_dates": backfill_session_dates,
+    "rebuild_threads": rebuild_threads,
+    "rebuild_analytics_rollups": rebuild_rollups,
+}
+
+async def _main(name: str) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    try:
+        count = await MIGRATIONS[name](client[os.environ["DB_NAME"]])
+    finally:
+        client.close()
+    print(f"{name}: {count} documents updated")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2 or sys.argv[1] not in MIGRATIONS:
+        print(f"Usage: python migrations.py <{'|'.join(MIGRATIONS)}>")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
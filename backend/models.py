@@ -79,14 +79,43 @@ class ChatMessage(BaseModel):
     response: Dict[str, Any]
     fetch_ui: bool
     personalized: bool
+    # Agent the client asked for; only records that have it also carry a reliable personalized flag
+    requested_agent: Optional[str] = None
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ChatThread(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    thread_id: str
+    user_id: str
+    title: str
+    message_count: int = 0
+    last_agent: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_activity: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 class ChatExecuteRequest(BaseModel):
     user_query: str
     agent_name: str = "smart_router"
     thread_id: Optional[str] = None
     fetch_ui: bool = False
     personalized: bool = False
+    # "no-cache" skips the response cache lookup, "no-store" bypasses the cache entirely
+    cache_control: Optional[str] = None
+
+class ChatJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    thread_id: str
+    request: Dict[str, Any]
+    status: str = "queued"  # queued, running, completed, failed, cancelled
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 class EditOperation(BaseModel):
     message_id: str
@@ -104,6 +133,8 @@ class AnalyticsEntry(BaseModel):
     agent_name: str
     tokens_used: int
     cost: float
+    latency_ms: Optional[float] = None
+    thread_id: Optional[str] = None
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserCredits(BaseModel):
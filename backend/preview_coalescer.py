@@ -0,0 +1,39 @@
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Hashable
+
+from ttl_cache import TTLCache
+
+class KeystrokeCoalescer:
+    """
+    Collapses bursts of preview requests from one client into the latest one.
+
+    Each request takes a ticket and waits ``window`` seconds; if the same client
+    sent a newer request meanwhile, or disconnected, the request is superseded
+    and should be answered without doing any work. Tickets are per worker.
+
+    Parameters
+    ----------
+    window:
+        Quiet period a request waits for newer keystrokes (0 disables coalescing).
+    maxsize:
+        Clients tracked at once; the least recently active are forgotten first.
+    """
+
+    def __init__(self, window: float = 0.1, maxsize: int = 10000) -> None:
+        self.window = window
+        self._latest: TTLCache = TTLCache(maxsize=maxsize, ttl=max(5.0, window * 10))
+        self._tickets = itertools.count()
+        self.superseded = 0
+
+    async def is_latest(self, client_key: Hashable, is_disconnected: Callable[[], Awaitable[bool]]) -> bool:
+        """Wait out the window; True if this is still the client's newest request."""
+        if self.window <= 0:
+            return not await is_disconnected()
+        ticket = next(self._tickets)
+        self._latest.set(client_key, ticket)
+        await asyncio.sleep(self.window)
+        if self._latest.get(client_key) != ticket or await is_disconnected():
+            self.superseded += 1
+            return False
+        return True
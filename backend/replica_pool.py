@@ -0,0 +1,194 @@
+"""
+DeepAgents replica selection.
+
+Threads are pinned to a replica by consistent hashing on ``thread_id`` so that
+chat calls and state lookups for a thread land where its state lives. Calls
+without affinity (new threads, hedged reads) go to the least loaded replica,
+by outstanding requests or by EWMA latency. Replicas are health-checked
+passively through their per-endpoint circuit breakers and actively by
+polling a health path.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import httpx
+
+from circuit_breaker import STATE_OPEN, EndpointHealth
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+STRATEGY_EWMA = "ewma"
+
+ENDPOINTS = ("chat", "state")
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+class Replica:
+    """One DeepAgents base URL with its load and health bookkeeping."""
+
+    def __init__(self, base_url: str, breaker_options: Dict[str, Any], ewma_alpha: float = 0.3) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.chat_url = f"{self.base_url}/api/v1/chat"
+        self.state_url = f"{self.base_url}/api/v1/state"
+        self.health = {endpoint: EndpointHealth(f"{endpoint}@{self.base_url}", **breaker_options) for endpoint in ENDPOINTS}
+        self.ewma_alpha = ewma_alpha
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.probe_healthy = True
+
+    def observe(self, latency: float) -> None:
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += self.ewma_alpha * (latency - self.ewma_latency)
+
+    def available(self, endpoint: str) -> bool:
+        return self.probe_healthy and self.health[endpoint].state != STATE_OPEN
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "url": self.base_url,
+            "healthy": self.probe_healthy,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            **{endpoint: health.snapshot() for endpoint, health in self.health.items()},
+        }
+
+class HashRing:
+    """Consistent hash ring with ``vnodes`` virtual nodes per replica."""
+
+    def __init__(self, replicas: Sequence[Replica], vnodes: int = 100) -> None:
+        self.replicas = list(replicas)
+        points = sorted(
+            (_hash(f"{replica.base_url}#{i}"), index)
+            for index, replica in enumerate(self.replicas)
+            for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def preference(self, key: str) -> List[Replica]:
+        """Every replica, ordered by ring position after ``key`` (owner first)."""
+        start = bisect.bisect(self._hashes, _hash(key))
+        order: List[Replica] = []
+        seen = set()
+        for offset in range(len(self._owners)):
+            index = self._owners[(start + offset) % len(self._owners)]
+            if index not in seen:
+                seen.add(index)
+                order.append(self.replicas[index])
+                if len(order) == len(self.replicas):
+                    break
+        return order
+
+class ReplicaPool:
+    """
+    Parameters
+    ----------
+    base_urls:
+        DeepAgents base URLs, one per replica.
+    breaker_options:
+        Keyword arguments for each replica's per-endpoint ``EndpointHealth``.
+    strategy:
+        ``least_outstanding`` or ``ewma`` (latency weighted by outstanding requests).
+    vnodes:
+        Virtual nodes per replica on the hash ring.
+    health_path:
+        Path polled by the active health check; any response below 500 counts as healthy.
+    health_interval:
+        Seconds between active checks (0 disables them).
+    """
+
+    def __init__(
+        self,
+        base_urls: Sequence[str],
+        breaker_options: Dict[str, Any],
+        strategy: str = STRATEGY_LEAST_OUTSTANDING,
+        vnodes: int = 100,
+        ewma_alpha: float = 0.3,
+        health_path: str = "/health",
+        health_interval: float = 10.0,
+    ) -> None:
+        if not base_urls:
+            raise ValueError("At least one DeepAgents URL is required")
+        self.replicas = [Replica(url, breaker_options, ewma_alpha) for url in base_urls]
+        self.ring = HashRing(self.replicas, vnodes)
+        self.strategy = strategy
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self._checker: Optional[asyncio.Task] = None
+
+    def _load(self, replica: Replica):
+        if self.strategy == STRATEGY_EWMA:
+            return (replica.ewma_latency or 0.0) * (replica.outstanding + 1)
+        return (replica.outstanding, replica.ewma_latency or 0.0)
+
+    def _usable(self, replicas: Iterable[Replica], endpoint: str) -> List[Replica]:
+        """Available replicas first; the rest stay as a last resort so their breakers can answer."""
+        replicas = list(replicas)
+        return [r for r in replicas if r.available(endpoint)] + [r for r in replicas if not r.available(endpoint)]
+
+    def owner(self, thread_id: str) -> Replica:
+        """The replica holding ``thread_id``'s state, whatever its health."""
+        return self.ring.preference(thread_id)[0]
+
+    def for_thread(self, thread_id: str, endpoint: str) -> List[Replica]:
+        """Candidates for a thread: its owner, then ring successors."""
+        return self._usable(self.ring.preference(thread_id), endpoint)
+
+    def by_load(self, endpoint: str, exclude: Sequence[Replica] = ()) -> List[Replica]:
+        """Candidates ordered by the balancing strategy, least loaded first."""
+        candidates = sorted((r for r in self.replicas if r not in exclude), key=self._load)
+        return self._usable(candidates, endpoint)
+
+    def new_thread_id(self, max_attempts: int = 64) -> str:
+        """
+        A fresh thread id whose ring owner is the least loaded available replica.
+
+        Affinity stays a pure function of the id (every worker agrees on the
+        owner) while new threads still follow the balancing strategy.
+        """
+        target = self.by_load("chat")[0]
+        thread_id = str(uuid.uuid4())
+        if len(self.replicas) == 1:
+            return thread_id
+        for _ in range(max_attempts):
+            if self.ring.preference(thread_id)[0] is target:
+                break
+            thread_id = str(uuid.uuid4())
+        return thread_id
+
+    def start(self, client_factory) -> None:
+        """Start active health checks; ``client_factory`` returns the shared HTTP client."""
+        if self._checker is None and self.health_interval > 0 and len(self.replicas) > 1:
+            self._checker = asyncio.create_task(self._check_loop(client_factory))
+
+    async def stop(self) -> None:
+        if self._checker is not None:
+            self._checker.cancel()
+            await asyncio.gather(self._checker, return_exceptions=True)
+            self._checker = None
+
+    async def _probe(self, client: httpx.AsyncClient, replica: Replica) -> None:
+        try:
+            response = await client.get(f"{replica.base_url}{self.health_path}", timeout=min(5.0, self.health_interval))
+            healthy = response.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy != replica.probe_healthy:
+            logger.warning("DeepAgents replica %s is now %s", replica.base_url, "healthy" if healthy else "unhealthy")
+        replica.probe_healthy = healthy
+
+    async def _check_loop(self, client_factory) -> None:
+        while True:
+            await asyncio.gather(*(self._probe(client_factory(), replica) for replica in self.replicas))
+            await asyncio.sleep(self.health_interval)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"strategy": self.strategy, "replicas": [replica.snapshot() for replica in self.replicas]}
@@ -0,0 +1,128 @@
+"""
+Two-tier cache of DeepAgents results for repeated research queries.
+
+Entries are keyed by the normalized ``(agent_name, user_query)`` pair, plus the
+user id for personalized requests. Lookups try an in-process TTL/LRU cache
+first, then the ``response_cache`` collection, whose TTL index drops expired
+entries. Concurrent misses for the same key share one upstream call.
+"""
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fast_json import dumps
+from ttl_cache import TTLCache
+
+COLLECTION = "response_cache"
+
+TIER_MEMORY = "memory"
+TIER_MONGO = "mongo"
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing-punctuation insensitive form of a query."""
+    text = unicodedata.normalize("NFKC", query).casefold()
+    return _WHITESPACE.sub(" ", text).strip().rstrip("?!. ")
+
+def cache_key(agent_name: str, query: str, user_id: Optional[str] = None) -> str:
+    raw = "\x00".join([agent_name, normalize_query(query), user_id or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def parse_cache_control(value: Optional[str]) -> Tuple[bool, bool]:
+    """(read, store) flags for a Cache-Control style value; no-cache skips the read, no-store both."""
+    directives = {part.strip().lower() for part in (value or "").split(",")}
+    if "no-store" in directives:
+        return False, False
+    return "no-cache" not in directives, True
+
+class ResponseCache:
+    """
+    Parameters
+    ----------
+    db:
+        Motor database handle for the second tier.
+    writer:
+        WriteBehindBuffer used to persist second-tier entries off the request path.
+    maxsize:
+        Entries kept in the in-process tier.
+    ttl:
+        Lifetime of an entry in seconds, in both tiers.
+    max_document_bytes:
+        Payloads larger than this stay in the in-process tier only.
+    """
+
+    def __init__(self, db, writer, maxsize: int = 1000, ttl: float = 3600.0, max_document_bytes: int = 1_000_000) -> None:
+        self.db = db
+        self.writer = writer
+        self.ttl = ttl
+        self.max_document_bytes = max_document_bytes
+        self._memory: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get(self, key: str) -> Optional[Tuple[Dict[str, Any], str, float]]:
+        """Return ``(payload, tier, age_seconds)`` for a live entry, else None."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, payload = entry
+            return payload, TIER_MEMORY, time.time() - stored_at
+
+        doc = await self.db[COLLECTION].find_one(
+            {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 0, "payload": 1, "created_at": 1, "expires_at": 1},
+        )
+        if not doc:
+            return None
+        created_at = doc["created_at"].replace(tzinfo=timezone.utc).timestamp()
+        remaining = doc["expires_at"].replace(tzinfo=timezone.utc).timestamp() - time.time()
+        self._memory.set(key, (created_at, doc["payload"]), ttl=remaining)
+        return doc["payload"], TIER_MONGO, time.time() - created_at
+
+    async def set(self, key: str, payload: Dict[str, Any], **fields: Any) -> None:
+        """Store ``payload`` in both tiers; ``fields`` are kept alongside it in Mongo."""
+        now = time.time()
+        self._memory.set(key, (now, payload))
+        if len(dumps(payload)) > self.max_document_bytes:
+            return
+        created_at = datetime.fromtimestamp(now, timezone.utc)
+        doc = {
+            **fields,
+            "key": key,
+            "payload": payload,
+            "created_at": created_at,
+            "expires_at": created_at + timedelta(seconds=self.ttl),
+        }
+        await self.writer.update(COLLECTION, {"key": key}, {"$set": doc}, upsert=True)
+
+    async def fetch(
+        self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]], store: bool = True, **fields: Any
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Run ``compute`` for a miss, sharing it with concurrent callers for the same key.
+
+        Returns the payload and whether this caller joined a call already in flight.
+        The shared call is shielded, so one caller disconnecting does not cancel it
+        for the others.
+        """
+        task = self._inflight.get(key)
+        joined = task is not None
+        if task is None:
+            task = asyncio.create_task(self._compute(key, compute, store, fields))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), joined
+
+    async def _compute(self, key: str, compute, store: bool, fields: Dict[str, Any]) -> Dict[str, Any]:
+        payload = await compute()
+        if store:
+            await self.set(key, payload, **fields)
+        return payload
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,179 @@
+"""
+Out-of-line storage for large DeepAgents responses.
+
+Payloads above a size threshold are compressed and written to a blob store;
+the chat_history document keeps a reference plus a small summary, and the
+full body is fetched lazily.
+"""
+import asyncio
+import gzip
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fast_json import dumps
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed responses")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+class BlobStore:
+    """Minimal async key/value interface for response bodies."""
+
+    name = "base"
+
+    async def put(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+class GridFSBlobStore(BlobStore):
+    """Blobs stored in a GridFS bucket on the application database."""
+
+    name = "gridfs"
+
+    def __init__(self, db, bucket_name: str = "chat_responses") -> None:
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def put(self, key: str, data: bytes) -> None:
+        await self.bucket.upload_from_stream_with_id(key, key, data)
+
+    async def get(self, key: str) -> bytes:
+        stream = await self.bucket.open_download_stream(key)
+        return await stream.read()
+
+    async def delete(self, key: str) -> None:
+        from gridfs.errors import NoFile
+
+        try:
+            await self.bucket.delete(key)
+        except NoFile:
+            pass
+
+class LocalBlobStore(BlobStore):
+    """Blobs stored as files under a local directory (or a mounted object store)."""
+
+    name = "local"
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def put(self, key: str, data: bytes) -> None:
+        await asyncio.to_thread(self._write, key, data)
+
+    async def get(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._path(key).read_bytes)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, True)
+
+class ResponseOffloader:
+    """
+    Move oversized response payloads out of chat_history documents.
+
+    Parameters
+    ----------
+    store:
+        Blob store receiving the compressed bodies.
+    threshold_bytes:
+        Payloads whose serialized size exceeds this are offloaded (0 disables).
+    codec:
+        ``zstd`` (needs the zstandard package), ``gzip`` or ``none``.
+    summary_chars:
+        Length of the ``result`` text kept inline in the history document.
+    """
+
+    def __init__(self, store: BlobStore, threshold_bytes: int = 65536, codec: str = "zstd", summary_chars: int = 2000) -> None:
+        if codec == "zstd" and zstandard is None:
+            logger.info("zstandard not installed; compressing offloaded responses with gzip")
+            codec = "gzip"
+        self.store = store
+        self.threshold_bytes = threshold_bytes
+        self.codec = codec
+        self.summary_chars = summary_chars
+
+    def _summary(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        result = payload.get("result")
+        if isinstance(result, str):
+            preview, truncated = result[:self.summary_chars], len(result) > self.summary_chars
+        else:
+            preview, truncated = None, result is not None
+        return {
+            "thread_id": payload.get("thread_id"),
+            "agent_name": payload.get("agent_name"),
+            "user_query": payload.get("user_query"),
+            "result": preview,
+            "result_truncated": truncated,
+        }
+
+    async def prepare(self, key: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the response dict to store inline, offloading ``payload`` if it is large."""
+        if self.threshold_bytes <= 0:
+            return payload
+
+        body = dumps(payload)
+        if len(body) <= self.threshold_bytes:
+            return payload
+
+        stored = await asyncio.to_thread(compress, body, self.codec)
+        await self.store.put(key, stored)
+        return {
+            **self._summary(payload),
+            "offloaded": True,
+            "blob": {
+                "store": self.store.name,
+                "key": key,
+                "codec": self.codec,
+                "size": len(body),
+                "stored_size": len(stored),
+            },
+        }
+
+    async def load(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the full payload for an inline response dict, fetching it if offloaded."""
+        blob: Optional[Dict[str, Any]] = response.get("blob") if response.get("offloaded") else None
+        if blob is None:
+            return response
+        stored = await self.store.get(blob["key"])
+        codec = blob.get("codec", "none")
+        return await asyncio.to_thread(lambda: json.loads(decompress(stored, codec)))
+
+    async def discard(self, response: Dict[str, Any]) -> None:
+        if response.get("offloaded") and response.get("blob"):
+            await self.store.delete(response["blob"]["key"])
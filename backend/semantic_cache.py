@@ -0,0 +1,271 @@
+"""
+Near-duplicate query cache over past chat_history answers.
+
+Queries are embedded with a hashed word / word-bigram / character-trigram
+vectorizer (no model download, CPU only) and kept in a NumPy matrix that is
+searched brute force with one matrix-vector product. A new conversation whose
+query is similar enough to an earlier one is answered with that earlier
+chat_history response instead of a DeepAgents run.
+"""
+import asyncio
+import logging
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from response_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+# Question scaffolding carries little meaning and would otherwise dominate short queries
+_STOPWORDS = frozenset(
+    "a an and are about as at be by can could do does for from give how i in is it me "
+    "of on or please s show tell that the this to was what whats which who whos why with "
+    "would you".split()
+)
+
+class HashedNgramVectorizer:
+    """
+    Signed feature hashing of words, word bigrams and character trigrams into
+    ``dim`` dimensions, L2 normalised so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        words = [word for word in _WORD.findall(normalize_query(text)) if word not in _STOPWORDS]
+        features = [(f"w:{word}", 1.0) for word in words]
+        features += [(f"b:{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f" {word} "
+            features += [(f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+        return features
+
+    def transform(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            vector[hashed % self.dim] += weight if hashed & 0x80000000 else -weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+class VectorIndex:
+    """
+    Brute-force inner-product index with a fixed capacity.
+
+    Rows are stored in one contiguous float32 matrix that grows by doubling; once
+    ``capacity`` is reached the oldest rows are overwritten.
+    """
+
+    def __init__(self, dim: int, capacity: int) -> None:
+        self.dim = dim
+        self.capacity = capacity
+        self._vectors = np.zeros((min(capacity, 1024), dim), dtype=np.float32)
+        self._entries: List[Any] = []
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._vectors.nbytes
+
+    def add(self, vector: np.ndarray, entry: Any) -> None:
+        self.extend(vector[np.newaxis, :], [entry])
+
+    def extend(self, vectors: np.ndarray, entries: Sequence[Any]) -> None:
+        for offset in range(0, len(entries), self.capacity):
+            self._extend(vectors[offset:offset + self.capacity], entries[offset:offset + self.capacity])
+
+    def _extend(self, vectors: np.ndarray, entries: Sequence[Any]) -> None:
+        needed = len(self._entries) + len(entries)
+        if needed > len(self._vectors) and len(self._vectors) < self.capacity:
+            grown = np.zeros((min(self.capacity, max(needed, 2 * len(self._vectors))), self.dim), dtype=np.float32)
+            grown[:len(self._entries)] = self._vectors[:len(self._entries)]
+            self._vectors = grown
+        for vector, entry in zip(vectors, entries):
+            self._vectors[self._next] = vector
+            if self._next < len(self._entries):
+                self._entries[self._next] = entry
+            else:
+                self._entries.append(entry)
+            self._next = (self._next + 1) % self.capacity
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[float, Any]]:
+        """The ``k`` most similar rows as ``(score, entry)``, best first."""
+        size = len(self._entries)
+        if not size or k <= 0:
+            return []
+        scores = self._vectors[:size] @ vector
+        if k < size:
+            top = np.argpartition(scores, size - k)[size - k:]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(float(scores[i]), self._entries[i]) for i in top]
+
+def _epoch(timestamp: Any) -> float:
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp).timestamp()
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return time.time()
+
+class SemanticCache:
+    """
+    Parameters
+    ----------
+    db:
+        Motor database handle; answers are read back from ``chat_history``.
+    dim:
+        Embedding dimensions (memory is ``4 * dim`` bytes per stored query).
+    max_entries:
+        Stored queries per worker; the oldest are dropped first.
+    threshold:
+        Minimum cosine similarity for a cached answer to be served.
+    max_age:
+        Answers older than this many seconds are reported but never served.
+    """
+
+    def __init__(
+        self,
+        db,
+        dim: int = 256,
+        max_entries: int = 50000,
+        threshold: float = 0.9,
+        max_age: float = 86400.0,
+    ) -> None:
+        self.db = db
+        self.threshold = threshold
+        self.max_age = max_age
+        self.vectorizer = HashedNgramVectorizer(dim)
+        self.index = VectorIndex(dim, max_entries)
+        self._load_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Index past conversations in the background; new ones are added as they happen."""
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load_logged())
+
+    async def stop(self) -> None:
+        if self._load_task is not None:
+            self._load_task.cancel()
+            await asyncio.gather(self._load_task, return_exceptions=True)
+            self._load_task = None
+
+    async def _load_logged(self) -> None:
+        try:
+            await self.load()
+        except Exception as exc:  # noqa: BLE001
+            logger.error("Failed to index past queries: %s", exc)
+
+    def add(self, message_id: str, query: str, agent_name: str, user_id: str, personalized: bool, timestamp: Any) -> None:
+        """Index the opening query of a conversation stored in chat_history."""
+        self.index.add(self.vectorizer.transform(query), {
+            "message_id": message_id,
+            "query": query,
+            "agent_name": agent_name,
+            "user_id": user_id,
+            "personalized": personalized,
+            "created_at": _epoch(timestamp),
+        })
+
+    def _matches(
+        self, query: str, user_id: str, agent_name: Optional[str], limit: int, personalized: bool = False
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        matches = []
+        for score, entry in self.index.search(self.vectorizer.transform(query), limit * 4):
+            # Personalized answers are only reused for their own user
+            if entry["personalized"] and entry["user_id"] != user_id:
+                continue
+            # A personalized request only takes the user's own personalized answers
+            if personalized and not entry["personalized"]:
+                continue
+            if agent_name is not None and entry["agent_name"] != agent_name:
+                continue
+            matches.append((score, entry))
+            if len(matches) == limit:
+                break
+        return matches
+
+    def _servable(self, score: float, entry: Dict[str, Any]) -> bool:
+        return score >= self.threshold and time.time() - entry["created_at"] <= self.max_age
+
+    def candidates(self, query: str, user_id: str, agent_name: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Most similar past queries visible to ``user_id``, best first.
+
+        The query text is only included for the user's own conversations.
+        """
+        now = time.time()
+        return [
+            {
+                "query": entry["query"] if entry["user_id"] == user_id else None,
+                "agent_name": entry["agent_name"],
+                "similarity": round(score, 4),
+                "age_seconds": round(now - entry["created_at"], 1),
+                "servable": self._servable(score, entry),
+            }
+            for score, entry in self._matches(query, user_id, agent_name, limit)
+        ]
+
+    async def lookup(
+        self, query: str, agent_name: str, user_id: str, personalized: bool = False
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """The stored response and similarity of the best servable match, if any."""
+        for score, entry in self._matches(query, user_id, agent_name, 3, personalized):
+            if not self._servable(score, entry):
+                continue
+            doc = await self.db.chat_history.find_one({"id": entry["message_id"]}, {"_id": 0, "response": 1})
+            if doc and doc.get("response"):
+                return doc["response"], round(score, 4)
+        return None
+
+    async def load(self) -> int:
+        """
+        Index the opening message of the most recent conversations in chat_history.
+
+        Conversations opened before records carried ``requested_agent`` are
+        skipped: their ``personalized`` flag was always False, so private
+        answers could otherwise be served to other users.
+        """
+        pipeline = [
+            {"$sort": {"timestamp": 1}},
+            {"$group": {
+                "_id": {"thread_id": "$thread_id", "user_id": "$user_id"},
+                "id": {"$first": "$id"},
+                "query": {"$first": "$query"},
+                "agent_name": {"$first": "$requested_agent"},
+                "personalized": {"$first": "$personalized"},
+                "timestamp": {"$first": "$timestamp"},
+            }},
+            {"$match": {"agent_name": {"$ne": None}}},
+            {"$sort": {"timestamp": -1}},
+            {"$limit": self.index.capacity},
+            {"$sort": {"timestamp": 1}},
+        ]
+        docs = await self.db.chat_history.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        vectors = np.stack([self.vectorizer.transform(doc["query"]) for doc in docs]) if docs else None
+        entries = [
+            {
+                "message_id": doc["id"],
+                "query": doc["query"],
+                "agent_name": doc["agent_name"],
+                "user_id": doc["_id"]["user_id"],
+                "personalized": bool(doc.get("personalized")),
+                "created_at": _epoch(doc.get("timestamp")),
+            }
+            for doc in docs
+        ]
+        if entries:
+            self.index.extend(vectors, entries)
+        logger.info("Indexed %d past queries for near-duplicate lookup", len(entries))
+        return len(entries)
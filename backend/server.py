@@ -1,23 +1,41 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Header, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timezone, timedelta
-import requests
-import uuid
+import time
+import base64
+import json
 import httpx
 
 from models import (
     WaitlistEntry, WaitlistCreate, User, UserSession,
-    Agent, UserAgent, ChatQuery, ChatMessage, ChatExecuteRequest,
+    Agent, UserAgent, ChatQuery, ChatMessage, ChatThread, ChatExecuteRequest, ChatJob,
     AnalyticsEntry, UserCredits, SessionDataResponse
 )
 from agent_orchestrator import AgentOrchestrator
+from circuit_breaker import CircuitOpenError
+from state_stream import StateBroadcaster
+from emergent_auth import EmergentAuthClient, InvalidSessionError
+from ttl_cache import TTLCache
+from db_indexes import ensure_indexes
+from agent_catalog import AgentCatalog
+from agent_router import AgentRouter
+from preview_coalescer import KeystrokeCoalescer
+from fast_json import FastJSONResponse
+from response_store import GridFSBlobStore, LocalBlobStore, ResponseOffloader
+from write_behind import WriteBehindBuffer
+from chat_jobs import ChatJobManager, JobQueueFull
+from response_cache import ResponseCache, cache_key, parse_cache_control
+from semantic_cache import SemanticCache
+from admission import AdmissionController, AdmissionLimits, AdmissionRejected, LocalAdmissionBackend, MongoAdmissionBackend
+import analytics_rollups
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -31,6 +49,18 @@ db = client[os.environ['DB_NAME']]
 DEEPAGENTS_URL = os.environ.get("DEEPAGENTS_URL", "http://108.130.44.215:8000")
 DEEPAGENTS_DEFAULT_AGENT = os.environ.get("DEEPAGENTS_DEFAULT_AGENT", "smart_router")
 DEEPAGENTS_TIMEOUT = int(os.environ.get("DEEPAGENTS_TIMEOUT", "5000"))
+# Cost charged for agents that are not in the catalog (e.g. the smart router)
+DEEPAGENTS_COST_PER_QUERY = float(os.environ.get("DEEPAGENTS_COST_PER_QUERY", "0"))
+# Chat history documents are written by this service; set to re-validate them on read
+VALIDATE_CHAT_HISTORY = os.environ.get("VALIDATE_CHAT_HISTORY", "false").lower() == "true"
+THREAD_TITLE_CHARS = int(os.environ.get("THREAD_TITLE_CHARS", "80"))
+# Emit Server-Timing headers with per-phase timings on instrumented endpoints
+DEBUG_TIMING = os.environ.get("DEBUG_TIMING", "false").lower() == "true"
+ANALYTICS_DAILY_DAYS = int(os.environ.get("ANALYTICS_DAILY_DAYS", "30"))
+CHAT_HISTORY_PREVIEW_CHARS = int(os.environ.get("CHAT_HISTORY_PREVIEW_CHARS", "200"))
+STATE_STREAM_INTERVAL = float(os.environ.get("STATE_STREAM_INTERVAL", "1.0"))
+STATE_STREAM_MAX_DURATION = float(os.environ.get("STATE_STREAM_MAX_DURATION", "600"))
+STATE_STREAM_IDLE_POLLS = int(os.environ.get("STATE_STREAM_IDLE_POLLS", "10"))
 
 # Create the main app
 app = FastAPI()
@@ -41,6 +71,99 @@ api_router = APIRouter(prefix="/api")
 # Initialize Agent Orchestrator
 orchestrator = AgentOrchestrator()
 
+# One upstream poller per thread, shared by every SSE subscriber
+state_broadcaster = StateBroadcaster(
+    orchestrator.get_state,
+    interval=STATE_STREAM_INTERVAL,
+    max_duration=STATE_STREAM_MAX_DURATION,
+    idle_polls=STATE_STREAM_IDLE_POLLS,
+)
+
+# Cached agent catalog served from memory with ETags
+agent_catalog = AgentCatalog(
+    db,
+    refresh_interval=float(os.environ.get("AGENT_CATALOG_REFRESH_INTERVAL", "300")),
+    use_change_stream=os.environ.get("AGENT_CATALOG_CHANGE_STREAM", "true").lower() == "true",
+)
+
+# Typing-time previews are routed locally against the catalog (rebuilt when its ETag changes)
+agent_router = AgentRouter(
+    DEEPAGENTS_DEFAULT_AGENT,
+    max_chain=int(os.environ.get("PREVIEW_MAX_CHAIN", "3")),
+    min_score=float(os.environ.get("PREVIEW_MIN_SCORE", "0.05")),
+)
+
+# Keystroke bursts from one client collapse into their latest preview request
+preview_coalescer = KeystrokeCoalescer(window=float(os.environ.get("PREVIEW_COALESCE_WINDOW", "0.1")))
+
+# Large DeepAgents responses are compressed into a blob store instead of chat_history
+if os.environ.get("RESPONSE_BLOB_STORE", "gridfs") == "local":
+    response_blob_store = LocalBlobStore(os.environ.get("RESPONSE_BLOB_DIR", str(ROOT_DIR / "response_blobs")))
+else:
+    response_blob_store = GridFSBlobStore(db)
+response_offloader = ResponseOffloader(
+    response_blob_store,
+    threshold_bytes=int(os.environ.get("RESPONSE_OFFLOAD_THRESHOLD", "65536")),
+    codec=os.environ.get("RESPONSE_COMPRESSION", "zstd"),
+    summary_chars=int(os.environ.get("RESPONSE_SUMMARY_CHARS", "2000")),
+)
+
+# Batched chat_history / threads / analytics writes; WRITE_DURABILITY=ack awaits each write
+write_buffer = WriteBehindBuffer(
+    db,
+    mode=os.environ.get("WRITE_DURABILITY", "buffered"),
+    batch_size=int(os.environ.get("WRITE_BATCH_SIZE", "100")),
+    flush_interval=float(os.environ.get("WRITE_FLUSH_INTERVAL", "0.2")),
+    max_pending=int(os.environ.get("WRITE_MAX_PENDING", "10000")),
+)
+
+# Per-user rate limit and in-flight caps on DeepAgents calls; ADMISSION_BACKEND=mongo
+# shares them across workers as renewed per-slot leases instead of per-process counters
+chat_admission = AdmissionController(
+    MongoAdmissionBackend(db, lease_ttl=float(os.environ.get("ADMISSION_LEASE_TTL", "60")))
+    if os.environ.get("ADMISSION_BACKEND", "local") == "mongo" else LocalAdmissionBackend(),
+    AdmissionLimits(
+        rate_per_second=float(os.environ.get("CHAT_RATE_LIMIT_PER_MINUTE", "30")) / 60.0,
+        burst=int(os.environ.get("CHAT_RATE_LIMIT_BURST", "10")),
+        max_inflight_per_user=int(os.environ.get("CHAT_MAX_INFLIGHT_PER_USER", "3")),
+        max_inflight_global=int(os.environ.get("CHAT_MAX_INFLIGHT", "64")),
+    ),
+    queue_timeout=float(os.environ.get("CHAT_ADMISSION_QUEUE_TIMEOUT", "10")),
+    max_queue=int(os.environ.get("CHAT_ADMISSION_MAX_QUEUE", "256")),
+)
+
+# Opt-in cache of DeepAgents results for new conversations, in memory and in Mongo
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+response_cache = ResponseCache(
+    db,
+    write_buffer,
+    maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", "1000")),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+)
+# DeepAgents never saw a cache-served answer, so the thread's first follow-up replays
+# the cached exchange (the answer truncated to this many characters)
+CACHE_CONTEXT_CHARS = int(os.environ.get("CACHE_CONTEXT_CHARS", "4000"))
+
+# Opt-in near-duplicate lookup: paraphrases of earlier opening queries reuse their answer
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+semantic_cache = SemanticCache(
+    db,
+    dim=int(os.environ.get("SEMANTIC_CACHE_DIM", "256")),
+    max_entries=int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "50000")),
+    threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+    max_age=float(os.environ.get("SEMANTIC_CACHE_MAX_AGE", "86400")),
+)
+
+# Pooled client for the Emergent Auth session exchange
+auth_client = EmergentAuthClient()
+
+# Resolved sessions keyed by token: (User, session expiry). Each worker has its own
+# cache, so a logout elsewhere is only seen here once the entry's TTL runs out.
+session_cache: TTLCache = TTLCache(
+    maxsize=int(os.environ.get("SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("SESSION_CACHE_TTL", "60")),
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -48,6 +171,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def as_utc(value: Any) -> datetime:
+    """Normalize a stored timestamp (legacy ISO string or naive BSON date) to aware UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
 # Helper function to get current user from session
 async def get_current_user(authorization: Optional[str] = None, session_token_cookie: Optional[str] = None) -> Optional[User]:
     """Get current user from session token (cookie or header)"""
@@ -56,31 +187,340 @@ async def get_current_user(authorization: Optional[str] = None, session_token_co
     if not token:
         return None
 
-    # Check if session exists and not expired
-    session = await db.user_sessions.find_one({
-        "session_token": token,
-        "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
-    })
+    now = datetime.now(timezone.utc)
+    cached = session_cache.get(token)
+    if cached is not None:
+        user, expires_at = cached
+        if expires_at > now:
+            return user
+        session_cache.pop(token)
 
-    if not session:
-        return None
+    # Resolve a live session and its user in one round-trip
+    pipeline = [
+        {"$match": {
+            "session_token": token,
+            # BSON dates, plus legacy sessions stored as ISO strings
+            "$or": [
+                {"expires_at": {"$gt": now}},
+                {"expires_at": {"$gt": now.isoformat()}}
+            ]
+        }},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "as": "user"
+        }},
+        {"$project": {"_id": 0, "expires_at": 1, "user": {"$arrayElemAt": ["$user", 0]}}}
+    ]
+    sessions = await db.user_sessions.aggregate(pipeline).to_list(1)
 
-    # Get user
-    user_doc = await db.users.find_one({"id": session["user_id"]}, {"_id": 0})
-    if not user_doc:
+    if not sessions or not sessions[0].get("user"):
         return None
 
-    return User(**user_doc)
+    session = sessions[0]
+    user = User(**session["user"])
+    expires_at = as_utc(session["expires_at"])
+    ttl = min(session_cache.ttl, (expires_at - now).total_seconds())
+    session_cache.set(token, (user, expires_at), ttl=ttl)
+    return user
 
 # ===== DeepAgents Helpers =====
-async def call_deepagents(agent_name: str, user_query: str, thread_id: str) -> Dict[str, Any]:
+async def call_deepagents(agent_name: str, user_query: str, thread_id: str, new_thread: bool = False) -> Dict[str, Any]:
     """Invoke DeepAgents chat endpoint and return JSON payload."""
     payload = {
         "agent_name": agent_name,
         "user_query": user_query,
         "thread_id": thread_id,
     }
-    return await orchestrator.send_chat(payload)
+    return await orchestrator.send_chat(payload, new_thread=new_thread)
+
+# ===== Pagination Helpers =====
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    """Opaque keyset cursor for the last document of a page"""
+    raw = json.dumps({"v": sort_value, "id": doc_id}, default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return {"v": data["v"], "id": data["id"]}
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(field: str, cursor: Optional[str], id_field: str = "id") -> Dict[str, Any]:
+    """Filter selecting documents after `cursor` in (field desc, id_field desc) order"""
+    if not cursor:
+        return {}
+    position = decode_cursor(cursor)
+    return {"$or": [
+        {field: {"$lt": position["v"]}},
+        {field: position["v"], id_field: {"$lt": position["id"]}}
+    ]}
+
+# ===== Thread Index Helpers =====
+async def record_thread_activity(
+    user_id: str,
+    thread_id: str,
+    query: str,
+    agent_name: str,
+    timestamp: str,
+    pending_context: Optional[Dict[str, Any]] = None,
+):
+    """Upsert the thread index entry for a new chat message"""
+    await write_buffer.update(
+        "threads",
+        {"thread_id": thread_id, "user_id": user_id},
+        {
+            "$set": {"last_activity": timestamp, "last_agent": agent_name, "pending_context": pending_context},
+            "$inc": {"message_count": 1},
+            "$setOnInsert": {"title": query[:THREAD_TITLE_CHARS], "created_at": timestamp}
+        },
+        upsert=True
+    )
+
+# ===== Timing Helpers =====
+async def timed(name: str, awaitable, timings: Dict[str, float]):
+    """Await `awaitable`, recording its duration in ms under `name`"""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = (time.perf_counter() - started) * 1000
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+# ===== Metering Helpers =====
+def extract_tokens_used(payload: Dict[str, Any]) -> int:
+    """Best-effort token count from a DeepAgents payload"""
+    if payload.get("tokens_used") is not None:
+        return int(payload["tokens_used"])
+    usage = payload.get("usage") or payload.get("token_usage") or {}
+    if usage.get("total_tokens") is not None:
+        return int(usage["total_tokens"])
+    return int(usage.get("input_tokens") or usage.get("prompt_tokens") or 0) + int(
+        usage.get("output_tokens") or usage.get("completion_tokens") or 0
+    )
+
+async def record_usage(user_id: str, agent_payload: Dict[str, Any], latency_ms: float, cached: bool = False):
+    """Record an analytics entry and charge credits; runs after the response is sent"""
+    agent_id = agent_payload["agent_name"]
+    catalog_agent = agent_catalog.by_id.get(agent_id)
+    if cached:
+        cost = 0.0
+    else:
+        cost = catalog_agent["cost_per_query"] if catalog_agent else DEEPAGENTS_COST_PER_QUERY
+
+    entry = AnalyticsEntry(
+        user_id=user_id,
+        agent_id=agent_id,
+        agent_name=catalog_agent["name"] if catalog_agent else agent_id,
+        tokens_used=extract_tokens_used(agent_payload),
+        cost=cost,
+        latency_ms=round(latency_ms, 1),
+        thread_id=agent_payload.get("thread_id"),
+    )
+    doc = entry.model_dump()
+    doc["timestamp"] = doc["timestamp"].isoformat()
+    await write_buffer.insert("analytics", doc)
+    for rollup_filter, rollup_update in analytics_rollups.rollup_updates(doc):
+        await write_buffer.update(analytics_rollups.COLLECTION, rollup_filter, rollup_update, upsert=True)
+
+    if cost:
+        await write_buffer.update(
+            "user_credits",
+            {"user_id": user_id},
+            {"$inc": {"used_credits": cost}, "$setOnInsert": {"total_credits": UserCredits(user_id=user_id).total_credits}},
+            upsert=True
+        )
+
+# ===== Chat Execution Helpers =====
+# Cache outcomes that did not cost an upstream call of their own
+CACHE_SERVED_STATUSES = ("hit", "coalesced")
+
+async def find_thread(user_id: str, thread_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The thread index entry if ``thread_id`` already has messages for this user"""
+    if not thread_id:
+        return None
+    return await db.threads.find_one(
+        {"thread_id": thread_id, "user_id": user_id, "message_count": {"$gt": 0}},
+        {"_id": 0, "pending_context": 1},
+    )
+
+def cached_exchange(query: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The cache-served exchange a thread's first follow-up replays to DeepAgents"""
+    result = payload.get("result")
+    text = result if isinstance(result, str) else json.dumps(result, default=str)
+    return {"query": query, "result": text[:CACHE_CONTEXT_CHARS]}
+
+def with_cached_context(query: str, context: Dict[str, Any]) -> str:
+    return (
+        f"Earlier in this conversation the user asked: {context['query']}\n"
+        f"The answer was: {context['result']}\n\n"
+        f"Follow-up question: {query}"
+    )
+
+async def fetch_agent_payload(
+    request: ChatExecuteRequest, user_id: str, agent_name: str, thread_id: str, thread: Optional[Dict[str, Any]]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Get the DeepAgents payload for a request, through the response caches when eligible.
+    Returns the payload and the cache report included in the execute response.
+    """
+    # Follow-ups (the thread already has messages) depend on thread context upstream,
+    # so only new conversations are cached
+    if thread is not None:
+        context = thread.get("pending_context")
+        if context:
+            # The conversation opened with a cached answer DeepAgents never saw on this thread
+            query = with_cached_context(request.user_query, context)
+            return await call_deepagents(agent_name, query, thread_id), {"status": "follow_up", "context": "replayed"}
+        return await call_deepagents(agent_name, request.user_query, thread_id), {"status": "follow_up"}
+    if not (RESPONSE_CACHE_ENABLED or SEMANTIC_CACHE_ENABLED):
+        return await call_deepagents(agent_name, request.user_query, thread_id, new_thread=True), {"status": "disabled"}
+
+    read, store = parse_cache_control(request.cache_control)
+    key = cache_key(agent_name, request.user_query, user_id if request.personalized else None)
+    if not read:
+        payload = await call_deepagents(agent_name, request.user_query, thread_id, new_thread=True)
+        if store and RESPONSE_CACHE_ENABLED:
+            await response_cache.set(key, payload, agent_name=agent_name, user_query=request.user_query)
+        return dict(payload), {"status": "bypass"}
+
+    cached = await response_cache.get(key) if RESPONSE_CACHE_ENABLED else None
+    if cached is not None:
+        payload, tier, age = cached
+        report = {"status": "hit", "tier": tier, "age_seconds": round(age, 1), "context": "deferred"}
+        return {**payload, "thread_id": thread_id}, report
+
+    near = None
+    if SEMANTIC_CACHE_ENABLED:
+        near = await semantic_cache.lookup(request.user_query, agent_name, user_id, request.personalized)
+    if near is not None:
+        stored, similarity = near
+        payload = await response_offloader.load(stored)
+        report = {"status": "hit", "tier": "semantic", "similarity": similarity, "context": "deferred"}
+        return {**payload, "thread_id": thread_id}, report
+
+    if not RESPONSE_CACHE_ENABLED:
+        return await call_deepagents(agent_name, request.user_query, thread_id, new_thread=True), {"status": "miss"}
+    payload, joined = await response_cache.fetch(
+        key,
+        lambda: call_deepagents(agent_name, request.user_query, thread_id, new_thread=True),
+        agent_name=agent_name,
+        user_query=request.user_query,
+    )
+    # Entries are shared: copy, and answer on this request's own thread
+    if joined:
+        return {**payload, "thread_id": thread_id}, {"status": "coalesced", "context": "deferred"}
+    return {**payload, "thread_id": thread_id}, {"status": "miss"}
+
+async def run_chat_query(request: ChatExecuteRequest, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any], float]:
+    """
+    Call DeepAgents for `request` and persist the chat record.
+    Returns the API response body, the raw agent payload and upstream latency in ms.
+    """
+    resolved_thread_id = request.thread_id or orchestrator.new_thread_id()
+    resolved_agent = request.agent_name or DEEPAGENTS_DEFAULT_AGENT
+    thread = await find_thread(user_id, request.thread_id)
+
+    started = time.perf_counter()
+    try:
+        agent_payload, cache_report = await fetch_agent_payload(request, user_id, resolved_agent, resolved_thread_id, thread)
+    except CircuitOpenError as exc:
+        logger.warning("Failing fast: %s", exc)
+        raise HTTPException(
+            status_code=503,
+            detail="DeepAgents service degraded",
+            headers={"Retry-After": str(int(exc.retry_after) or 1)}
+        ) from exc
+    except httpx.HTTPStatusError as exc:
+        logger.error("DeepAgents responded with error: %s", exc)
+        raise HTTPException(status_code=exc.response.status_code, detail="DeepAgents service error") from exc
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Failed to reach DeepAgents: %s", exc)
+        raise HTTPException(status_code=502, detail="DeepAgents service unavailable") from exc
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    agent_payload.setdefault("thread_id", resolved_thread_id)
+    agent_payload.setdefault("agent_name", resolved_agent)
+    agent_payload.setdefault("user_query", request.user_query)
+
+    chat_message = ChatMessage(
+        user_id=user_id,
+        thread_id=agent_payload["thread_id"],
+        query=request.user_query,
+        agent_chain=[
+            {
+                "agent_id": agent_payload["agent_name"],
+                "agent_name": agent_payload["agent_name"],
+                "purpose": "Processed via DeepAgents",
+            }
+        ],
+        response=agent_payload,
+        fetch_ui=False,
+        personalized=request.personalized,
+        requested_agent=resolved_agent,
+    )
+
+    record = chat_message.model_dump()
+    record["timestamp"] = record["timestamp"].isoformat()
+    record["response"] = await response_offloader.prepare(record["id"], record["response"])
+    await write_buffer.insert("chat_history", record)
+    await record_thread_activity(
+        user_id,
+        chat_message.thread_id,
+        request.user_query,
+        agent_payload["agent_name"],
+        record["timestamp"],
+        pending_context=cached_exchange(request.user_query, agent_payload) if cache_report.get("context") == "deferred" else None,
+    )
+    if SEMANTIC_CACHE_ENABLED and cache_report["status"] in ("miss", "bypass") and parse_cache_control(request.cache_control)[1]:
+        # Keyed on the requested agent, which is what lookups filter on
+        semantic_cache.add(record["id"], request.user_query, resolved_agent, user_id, request.personalized, record["timestamp"])
+
+    body = {
+        "thread_id": agent_payload["thread_id"],
+        "agent_name": agent_payload["agent_name"],
+        "result": agent_payload.get("result"),
+        "sources": agent_payload.get("source", []),
+        "raw_response": agent_payload,
+        "cache": cache_report,
+    }
+    return body, agent_payload, latency_ms
+
+def admission_http_error(exc: AdmissionRejected) -> HTTPException:
+    logger.info("Chat request rejected by admission control: %s", exc.reason)
+    return HTTPException(status_code=429, detail=exc.reason, headers={"Retry-After": str(exc.retry_after)})
+
+# Background jobs may wait longer for a slot than interactive requests
+CHAT_JOB_ADMISSION_TIMEOUT = float(os.environ.get("CHAT_JOB_ADMISSION_TIMEOUT", "300"))
+
+async def run_chat_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute a queued chat job; the stored result may be offloaded like chat responses"""
+    body, agent_payload, latency_ms = await run_chat_query(ChatExecuteRequest(**job["request"]), job["user_id"])
+    await record_usage(job["user_id"], agent_payload, latency_ms, cached=body["cache"]["status"] in CACHE_SERVED_STATUSES)
+    return await response_offloader.prepare(f"job-{job['id']}", body)
+
+def admit_chat_job(job: Dict[str, Any]):
+    """The rate-limit token was taken at submission; the job still needs an in-flight slot"""
+    return chat_admission.hold_slot(job["user_id"], queue_timeout=CHAT_JOB_ADMISSION_TIMEOUT)
+
+# Background chat jobs, bounded per worker
+chat_jobs = ChatJobManager(
+    db,
+    run_chat_job,
+    max_concurrency=int(os.environ.get("CHAT_JOB_MAX_CONCURRENCY", "8")),
+    max_queued=int(os.environ.get("CHAT_JOB_MAX_QUEUED", "100")),
+    heartbeat_interval=float(os.environ.get("CHAT_JOB_HEARTBEAT_INTERVAL", "15")),
+    stale_after=float(os.environ.get("CHAT_JOB_STALE_AFTER", "60")),
+    max_attempts=int(os.environ.get("CHAT_JOB_MAX_ATTEMPTS", "2")),
+    admit=admit_chat_job,
+    admission_retry=float(os.environ.get("CHAT_JOB_ADMISSION_RETRY", "5")),
+)
 
 # ===== WAITLIST ENDPOINTS =====
 @api_router.post("/waitlist", response_model=WaitlistEntry)
@@ -128,17 +568,11 @@ async def process_session(x_session_id: str = Header(...)):
     """Process Google OAuth session ID from Emergent Auth"""
     try:
         # Call Emergent auth service
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": x_session_id},
-            timeout=10
-        )
-
-        if response.status_code != 200:
+        try:
+            data = await auth_client.fetch_session_data(x_session_id)
+        except InvalidSessionError:
             raise HTTPException(status_code=401, detail="Invalid session")
 
-        data = response.json()
-
         # Check if user exists
         user_doc = await db.users.find_one({"email": data["email"]})
 
@@ -167,11 +601,8 @@ async def process_session(x_session_id: str = Header(...)):
             session_token=session_token,
             expires_at=expires_at
         )
-        session_dict = session.model_dump()
-        session_dict['expires_at'] = session_dict['expires_at'].isoformat()
-        session_dict['created_at'] = session_dict['created_at'].isoformat()
-
-        await db.user_sessions.insert_one(session_dict)
+        # Stored as BSON dates so the TTL index can expire them
+        await db.user_sessions.insert_one(session.model_dump())
 
         return SessionDataResponse(
             id=data["id"],
@@ -181,7 +612,7 @@ async def process_session(x_session_id: str = Header(...)):
             session_token=session_token
         )
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error calling auth service: {e}")
         raise HTTPException(status_code=500, detail="Authentication failed")
 
@@ -206,6 +637,7 @@ async def logout(
     token = session_token or (authorization.replace("Bearer ", "") if authorization else None)
 
     if token:
+        session_cache.pop(token)
         await db.user_sessions.delete_one({"session_token": token})
 
     # Clear cookie
@@ -214,16 +646,16 @@ async def logout(
 
 # ===== AGENT ENDPOINTS =====
 @api_router.get("/agents", response_model=List[Agent])
-async def get_all_agents():
+async def get_all_agents(if_none_match: Optional[str] = Header(None)):
     """Get all available agents"""
-    agents = await db.agents.find({}, {"_id": 0}).to_list(100)
-    return agents
+    await agent_catalog.ensure_loaded()
+    return agent_catalog.response(if_none_match)
 
 @api_router.get("/agents/public", response_model=List[Agent])
-async def get_all_agents_public():
+async def get_all_agents_public(if_none_match: Optional[str] = Header(None)):
     """Get all available agents (public endpoint for development)"""
-    agents = await db.agents.find({}, {"_id": 0}).to_list(100)
-    return agents
+    await agent_catalog.ensure_loaded()
+    return agent_catalog.response(if_none_match)
 
 @api_router.get("/agents/subscribed", response_model=List[Agent])
 async def get_subscribed_agents(
@@ -240,8 +672,8 @@ async def get_subscribed_agents(
     agent_ids = [ua["agent_id"] for ua in user_agents]
 
     # Get agent details
-    agents = await db.agents.find({"id": {"$in": agent_ids}}, {"_id": 0}).to_list(100)
-    return agents
+    await agent_catalog.ensure_loaded()
+    return [agent_catalog.by_id[agent_id] for agent_id in agent_ids if agent_id in agent_catalog.by_id]
 
 @api_router.post("/agents/{agent_id}/subscribe")
 async def subscribe_agent(
@@ -287,101 +719,187 @@ async def unsubscribe_agent(
 @api_router.post("/chat/preview")
 async def preview_agent_chain(
     query: ChatQuery,
+    raw_request: Request,
     authorization: Optional[str] = Header(None),
-    session_token: Optional[str] = Header(None)
+    session_token: Optional[str] = Header(None),
+    user_agent: Optional[str] = Header(None)
 ):
-    """Preview agent chain for a query (called as user types)."""
-    _ = await get_current_user(authorization, session_token)
-
-    return {
-        "agent_chain": [
-            {
-                "agent_id": DEEPAGENTS_DEFAULT_AGENT,
-                "agent_name": DEEPAGENTS_DEFAULT_AGENT,
-                "purpose": "Routed via DeepAgents smart router",
-            }
-        ]
-    }
+    """Preview agent chain for a query (called as user types); superseded requests get 204."""
+    host = raw_request.client.host if raw_request.client else ""
+    client_key = authorization or session_token or f"{host}|{user_agent}"
+    if not await preview_coalescer.is_latest(client_key, raw_request.is_disconnected):
+        return Response(status_code=204)
+
+    await agent_catalog.ensure_loaded()
+    agent_router.ensure_current(agent_catalog.agents, agent_catalog.etag)
+    preview = agent_router.preview(query.query)
+    # Only the similar-query lookup is per user; plain routing never resolves the session
+    if SEMANTIC_CACHE_ENABLED and not await raw_request.is_disconnected():
+        user = await get_current_user(authorization, session_token)
+        user_id = user.id if user else "demo-user-123"
+        preview["similar_queries"] = semantic_cache.candidates(query.query, user_id)
+    return preview
 
 @api_router.post("/chat/execute")
 async def execute_chat_query(
     request: ChatExecuteRequest,
+    background_tasks: BackgroundTasks,
     authorization: Optional[str] = Header(None),
-    session_token: Optional[str] = Header(None)
+    session_token: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None)
 ):
     """Execute query via DeepAgents and persist a minimal chat record."""
     user = await get_current_user(authorization, session_token)
     user_id = user.id if user else "demo-user-123"
-
-    resolved_thread_id = request.thread_id or str(uuid.uuid4())
-    resolved_agent = request.agent_name or DEEPAGENTS_DEFAULT_AGENT
+    request.cache_control = request.cache_control or cache_control
 
     try:
-        agent_payload = await call_deepagents(
-            resolved_agent,
-            request.user_query,
-            resolved_thread_id,
-        )
-    except httpx.HTTPStatusError as exc:
-        logger.error("DeepAgents responded with error: %s", exc)
-        raise HTTPException(status_code=exc.response.status_code, detail="DeepAgents service error") from exc
-    except Exception as exc:  # noqa: BLE001
-        logger.error("Failed to reach DeepAgents: %s", exc)
-        raise HTTPException(status_code=502, detail="DeepAgents service unavailable") from exc
+        async with chat_admission.admit(user_id):
+            body, agent_payload, latency_ms = await run_chat_query(request, user_id)
+    except AdmissionRejected as exc:
+        raise admission_http_error(exc) from exc
+    background_tasks.add_task(
+        record_usage, user_id, agent_payload, latency_ms, cached=body["cache"]["status"] in CACHE_SERVED_STATUSES
+    )
 
-    agent_payload.setdefault("thread_id", resolved_thread_id)
-    agent_payload.setdefault("agent_name", resolved_agent)
-    agent_payload.setdefault("user_query", request.user_query)
+    return FastJSONResponse(body)
 
-    chat_message = ChatMessage(
+@api_router.post("/chat/jobs", status_code=202)
+async def submit_chat_job(
+    request: ChatExecuteRequest,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Header(None)
+):
+    """Start a DeepAgents query in the background and return its job id immediately."""
+    user = await get_current_user(authorization, session_token)
+    user_id = user.id if user else "demo-user-123"
+
+    try:
+        await chat_admission.check_rate(user_id)
+    except AdmissionRejected as exc:
+        raise admission_http_error(exc) from exc
+
+    job = ChatJob(
         user_id=user_id,
-        thread_id=agent_payload["thread_id"],
-        query=request.user_query,
-        agent_chain=[
-            {
-                "agent_id": agent_payload["agent_name"],
-                "agent_name": agent_payload["agent_name"],
-                "purpose": "Processed via DeepAgents",
-            }
-        ],
-        response=agent_payload,
-        fetch_ui=False,
-        personalized=False,
+        request=request.model_dump(),
+        thread_id=request.thread_id or orchestrator.new_thread_id(),
     )
+    job_doc = job.model_dump(exclude={"status", "created_at"})
+    job_doc["request"]["thread_id"] = job.thread_id
+    try:
+        await chat_jobs.submit(job_doc)
+    except JobQueueFull:
+        raise HTTPException(status_code=429, detail="Too many chat jobs in progress", headers={"Retry-After": "5"})
 
-    record = chat_message.model_dump()
-    record["timestamp"] = record["timestamp"].isoformat()
-    await db.chat_history.insert_one(record)
+    return {"job_id": job.id, "thread_id": job.thread_id, "status": job_doc["status"]}
 
-    return {
-        "thread_id": agent_payload["thread_id"],
-        "agent_name": agent_payload["agent_name"],
-        "result": agent_payload.get("result"),
-        "sources": agent_payload.get("source", []),
-        "raw_response": agent_payload,
-    }
+@api_router.get("/chat/jobs/{job_id}")
+async def get_chat_job(
+    job_id: str,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Header(None)
+):
+    """Get a chat job's status, and its result once completed."""
+    user = await get_current_user(authorization, session_token)
+    user_id = user.id if user else "demo-user-123"
+
+    job = await chat_jobs.get(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.get("result"):
+        job["result"] = await response_offloader.load(job["result"])
+
+    return FastJSONResponse(job)
+
+@api_router.delete("/chat/jobs/{job_id}")
+async def cancel_chat_job(
+    job_id: str,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Header(None)
+):
+    """Cancel a queued or running chat job."""
+    user = await get_current_user(authorization, session_token)
+    user_id = user.id if user else "demo-user-123"
+
+    if not await chat_jobs.cancel(job_id, user_id):
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+
+    return {"message": "Job cancelled", "job_id": job_id}
 
 @api_router.get("/chat/history", response_model=List[ChatMessage])
 async def get_chat_history(
+    response: Response,
     authorization: Optional[str] = Header(None),
     session_token: Optional[str] = Header(None),
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: str = "full"
 ):
-    """Get user's chat history."""
+    """
+    Get user's chat history, newest first.
+
+    Pages are keyed on (timestamp, id); pass the X-Next-Cursor header of one page
+    as `cursor` to fetch the next. `fields=summary` returns only id, thread_id,
+    query, agent_name, timestamp and a truncated result preview.
+    """
+    if fields not in ("full", "summary"):
+        raise HTTPException(status_code=400, detail="fields must be 'full' or 'summary'")
+
     user = await get_current_user(authorization, session_token)
     user_id = user.id if user else "demo-user-123"
 
-    messages = await db.chat_history.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
-
+    query = {"user_id": user_id, **keyset_filter("timestamp", cursor)}
+    if fields == "summary":
+        projection = {
+            "_id": 0,
+            "id": 1,
+            "thread_id": 1,
+            "query": 1,
+            "timestamp": 1,
+            "agent_name": "$response.agent_name",
+            "preview": {"$cond": [
+                {"$eq": [{"$type": "$response.result"}, "string"]},
+                {"$substrCP": ["$response.result", 0, CHAT_HISTORY_PREVIEW_CHARS]},
+                None
+            ]}
+        }
+    else:
+        projection = {"_id": 0}
+
+    messages = await db.chat_history.find(query, projection).sort(
+        [("timestamp", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+
+    headers = {}
+    if len(messages) == limit and messages:
+        headers["X-Next-Cursor"] = encode_cursor(messages[-1]["timestamp"], messages[-1]["id"])
+
+    if fields == "summary" or not VALIDATE_CHAT_HISTORY:
+        return FastJSONResponse(messages, headers=headers)
+
+    response.headers.update(headers)
     for msg in messages:
         if isinstance(msg["timestamp"], str):
             msg["timestamp"] = datetime.fromisoformat(msg["timestamp"])
 
     return messages
 
+@api_router.get("/chat/message/{message_id}/response")
+async def get_chat_message_response(
+    message_id: str,
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Header(None)
+):
+    """Get the full DeepAgents response for a message, loading it from the blob store if offloaded."""
+    user = await get_current_user(authorization, session_token)
+    user_id = user.id if user else "demo-user-123"
+
+    doc = await db.chat_history.find_one({"id": message_id, "user_id": user_id}, {"_id": 0, "response": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Message not found")
+
+    return FastJSONResponse(await response_offloader.load(doc.get("response") or {}))
+
 @api_router.get("/chat/state/{thread_id}")
 async def get_chat_state(thread_id: str):
     """Poll for background process/thinking steps for a thread."""
@@ -394,6 +912,42 @@ async def get_chat_state(thread_id: str):
         logger.error("Error polling state: %s", exc)
         return {"status": "unknown", "thinking_steps": []}
 
+@api_router.get("/chat/state/{thread_id}/stream")
+async def stream_chat_state(thread_id: str):
+    """Stream thread state changes as Server-Sent Events (delta and done events)."""
+    return StreamingResponse(
+        state_broadcaster.subscribe(thread_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/chat/threads", response_model=List[ChatThread])
+async def list_chat_threads(
+    authorization: Optional[str] = Header(None),
+    session_token: Optional[str] = Header(None),
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
+    """List the user's threads, most recently active first (paged via X-Next-Cursor)."""
+    user = await get_current_user(authorization, session_token)
+    user_id = user.id if user else "demo-user-123"
+
+    query = {"user_id": user_id, **keyset_filter("last_activity", cursor, id_field="thread_id")}
+    threads = await db.threads.find(query, {"_id": 0, "pending_context": 0}).sort(
+        [("last_activity", -1), ("thread_id", -1)]
+    ).limit(limit).to_list(limit)
+
+    headers = {}
+    if len(threads) == limit and threads:
+        headers["X-Next-Cursor"] = encode_cursor(threads[-1]["last_activity"], threads[-1]["thread_id"])
+
+    return FastJSONResponse(threads, headers=headers)
+
+@api_router.get("/health/deepagents")
+async def deepagents_health():
+    """Load, circuit state, error rate and latency percentiles per DeepAgents replica and endpoint."""
+    return orchestrator.health_snapshot()
+
 @api_router.delete("/chat/thread/{thread_id}")
 async def delete_thread(
     thread_id: str,
@@ -404,8 +958,16 @@ async def delete_thread(
     user = await get_current_user(authorization, session_token)
     user_id = user.id if user else "demo-user-123"
 
+    offloaded = await db.chat_history.find(
+        {"thread_id": thread_id, "user_id": user_id, "response.offloaded": True},
+        {"_id": 0, "response.offloaded": 1, "response.blob": 1}
+    ).to_list(None)
+
     # Delete all messages with this thread_id
     result = await db.chat_history.delete_many({"thread_id": thread_id, "user_id": user_id})
+    for doc in offloaded:
+        await response_offloader.discard(doc["response"])
+    await db.threads.delete_one({"thread_id": thread_id, "user_id": user_id})
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Thread not found")
@@ -415,61 +977,62 @@ async def delete_thread(
 # ===== ANALYTICS ENDPOINTS =====
 @api_router.get("/analytics")
 async def get_analytics(
+    response: Response,
     authorization: Optional[str] = Header(None),
     session_token: Optional[str] = Header(None),
     limit: int = 100
 ):
     """Get user's usage analytics"""
-    user = await get_current_user(authorization, session_token)
+    timings: Dict[str, float] = {}
+    user = await timed("auth", get_current_user(authorization, session_token), timings)
     user_id = user.id if user else "demo-user-123"
 
-    # Get analytics entries with limit
-    entries = await db.analytics.find(
-        {"user_id": user_id},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    # Recent entries, credit balance and rollups are independent; fetch them concurrently
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=ANALYTICS_DAILY_DAYS)).strftime("%Y-%m-%d")
+    started = time.perf_counter()
+    entries, credits, rollups = await asyncio.gather(
+        timed("entries", db.analytics.find(
+            {"user_id": user_id},
+            {"_id": 0}
+        ).sort("timestamp", -1).limit(limit).to_list(limit), timings),
+        timed("credits", db.user_credits.find_one({"user_id": user_id}, {"_id": 0}), timings),
+        # Totals, per-agent and recent daily usage from the incrementally maintained rollups
+        timed("rollups", db[analytics_rollups.COLLECTION].find(
+            {"user_id": user_id, "$or": [
+                {"scope": {"$in": [analytics_rollups.SCOPE_USER, analytics_rollups.SCOPE_AGENT]}},
+                {"scope": analytics_rollups.SCOPE_DAY, "day": {"$gte": cutoff}}
+            ]},
+            {"_id": 0}
+        ).to_list(None), timings),
+    )
+    timings["db_total"] = (time.perf_counter() - started) * 1000
+
+    if DEBUG_TIMING:
+        response.headers["Server-Timing"] = server_timing_header(timings)
 
     for entry in entries:
         if isinstance(entry.get('timestamp'), str):
             entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
 
-    # Get credit balance
-    credits = await db.user_credits.find_one({"user_id": user_id}, {"_id": 0})
-
-    # Aggregate stats from limited entries
-    total_queries = await db.analytics.count_documents({"user_id": user_id})
-    
-    # Calculate total cost using aggregation
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$group": {
-            "_id": None,
-            "total_cost": {"$sum": "$cost"}
-        }}
-    ]
-    cost_result = await db.analytics.aggregate(pipeline).to_list(1)
-    total_cost = cost_result[0]["total_cost"] if cost_result else 0
-    
-    # Agent usage stats using aggregation
-    agent_pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$group": {
-            "_id": "$agent_name",
-            "queries": {"$sum": 1},
-            "cost": {"$sum": "$cost"}
-        }}
-    ]
-    agent_results = await db.analytics.aggregate(agent_pipeline).to_list(100)
-    agent_usage = {
-        item["_id"]: {"queries": item["queries"], "cost": item["cost"]}
-        for item in agent_results
-    }
+    total_queries = 0
+    total_cost = 0
+    agent_usage = {}
+    daily_usage = {}
+    for rollup in rollups:
+        if rollup["scope"] == analytics_rollups.SCOPE_USER:
+            total_queries = rollup.get("queries", 0)
+            total_cost = rollup.get("cost", 0)
+        elif rollup["scope"] == analytics_rollups.SCOPE_AGENT:
+            agent_usage[rollup["agent_name"]] = {"queries": rollup.get("queries", 0), "cost": rollup.get("cost", 0)}
+        else:
+            daily_usage[rollup["day"]] = {"queries": rollup.get("queries", 0), "cost": rollup.get("cost", 0)}
 
     return {
         "total_queries": total_queries,
         "total_cost": total_cost,
         "credits": credits,
         "agent_usage": agent_usage,
+        "daily_usage": dict(sorted(daily_usage.items())),
         "recent_entries": entries[:50]
     }
 
@@ -502,13 +1065,15 @@ else:
 
 @app.on_event("startup")
 async def startup_db():
-    """Initialize database with default agents"""
+    """Ensure indexes and initialize database with default agents"""
     try:
         count = await db.agents.count_documents({})
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB during startup: {e}")
         logger.warning("Server will continue but database operations may fail")
         return
+
+    await ensure_indexes(db)
     
     if count == 0:
         default_agents = [
@@ -532,6 +1097,33 @@ async def startup_db():
         await db.agents.insert_many(default_agents)
         logger.info("Initialized agents")
 
+    await agent_catalog.start()
+    # Also picks up jobs left active by a worker that was killed
+    chat_jobs.start()
+    if SEMANTIC_CACHE_ENABLED:
+        semantic_cache.start()
+
+@app.on_event("startup")
+async def startup_http_clients():
+    """Open the pooled DeepAgents and Emergent Auth HTTP clients"""
+    await orchestrator.startup()
+    await auth_client.startup()
+
 @app.on_event("shutdown")
-async def shutdown_db_client():
+async def shutdown_app():
+    """
+    Stop background work, then close the clients it uses.
+
+    Chat jobs are requeued and state pollers stopped before the pooled HTTP
+    clients close, so in-flight DeepAgents calls are cancelled rather than
+    failing on a closed client; buffered writes flush before MongoDB closes.
+    """
+    await chat_jobs.shutdown()
+    await state_broadcaster.shutdown()
+    await chat_admission.stop()
+    await orchestrator.shutdown()
+    await auth_client.shutdown()
+    await agent_catalog.stop()
+    await semantic_cache.stop()
+    await write_buffer.stop()
     client.close()
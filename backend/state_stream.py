@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+StateFetcher = Callable[[str], Awaitable[Dict[str, Any]]]
+
+# Upstream statuses meaning a run has ended
+TERMINAL_STATUSES = frozenset({"completed", "complete", "done", "finished", "success", "error", "failed", "cancelled"})
+
+def _item_key(item: Any) -> str:
+    return json.dumps(item, sort_keys=True, default=str)
+
+def _without_output(delta: Optional[Dict[str, Any]], output_key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Drop ``output`` from a delta when it is the given (previous turn's) output."""
+    if not delta or output_key is None or _item_key(delta.get("output")) != output_key:
+        return delta
+    delta = {key: value for key, value in delta.items() if key != "output"}
+    return delta if set(delta) - {"agent_name"} else None
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+class _ThreadDiff:
+    """Remembers what has already been pushed for a thread so only changes go out."""
+
+    def __init__(self) -> None:
+        self.seen_steps: Set[str] = set()
+        self.seen_messages: Set[str] = set()
+        self.pending_writes_key: Optional[str] = None
+        self.output_key: Optional[str] = None
+        self.status: Optional[str] = None
+
+    @staticmethod
+    def _messages(payload: Dict[str, Any]) -> List[Any]:
+        messages = list(payload.get("messages") or [])
+        channel_messages = ((payload.get("state") or {}).get("channels") or {}).get("messages")
+        if isinstance(channel_messages, list):
+            messages.extend(channel_messages)
+        return messages
+
+    def apply(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the delta between ``payload`` and what was seen before, or None."""
+        delta: Dict[str, Any] = {}
+
+        new_steps = []
+        for step in payload.get("thinking_steps") or []:
+            key = _item_key(step)
+            if key not in self.seen_steps:
+                self.seen_steps.add(key)
+                new_steps.append(step)
+        if new_steps:
+            delta["thinking_steps"] = new_steps
+
+        new_messages = []
+        for message in self._messages(payload):
+            key = _item_key(message)
+            if key not in self.seen_messages:
+                self.seen_messages.add(key)
+                new_messages.append(message)
+        if new_messages:
+            delta["messages"] = new_messages
+
+        state = payload.get("state") or {}
+        pending_writes = state.get("pending_writes")
+        if pending_writes is not None:
+            key = _item_key(pending_writes)
+            if key != self.pending_writes_key:
+                self.pending_writes_key = key
+                delta["pending_writes"] = pending_writes
+
+        output = (state.get("channels") or {}).get("output")
+        if output:
+            key = _item_key(output)
+            if key != self.output_key:
+                self.output_key = key
+                delta["output"] = output
+
+        status = payload.get("status")
+        if status and status != self.status:
+            self.status = status
+            delta["status"] = status
+
+        if not delta:
+            return None
+        if payload.get("agent_name"):
+            delta["agent_name"] = payload["agent_name"]
+        return delta
+
+class _ThreadPoller:
+    def __init__(self, thread_id: str) -> None:
+        self.thread_id = thread_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.last_snapshot: Optional[Dict[str, Any]] = None
+        # Output already in the thread when polling started (a previous turn's answer)
+        self.baseline_output: Optional[str] = None
+
+class StateBroadcaster:
+    """
+    Poll DeepAgents once per thread and fan changes out to every SSE subscriber.
+
+    Parameters
+    ----------
+    fetch_state:
+        Coroutine returning the DeepAgents state payload for a thread id.
+    interval:
+        Seconds between upstream polls while at least one subscriber is listening.
+    max_duration:
+        Upper bound on how long a thread is polled before the stream is closed.
+    idle_polls:
+        Consecutive polls of a thread that is already finished and unchanged
+        (no new run started) after which the stream is closed.
+    """
+
+    def __init__(
+        self, fetch_state: StateFetcher, interval: float = 1.0, max_duration: float = 600.0, idle_polls: int = 10
+    ) -> None:
+        self.fetch_state = fetch_state
+        self.interval = interval
+        self.max_duration = max_duration
+        self.idle_polls = idle_polls
+        self._pollers: Dict[str, _ThreadPoller] = {}
+
+    def _poller_for(self, thread_id: str) -> _ThreadPoller:
+        poller = self._pollers.get(thread_id)
+        if poller is None:
+            poller = _ThreadPoller(thread_id)
+            self._pollers[thread_id] = poller
+            poller.task = asyncio.create_task(self._run(poller))
+        return poller
+
+    def _publish(self, poller: _ThreadPoller, event: str, data: Any) -> None:
+        for queue in poller.subscribers:
+            queue.put_nowait((event, data))
+
+    async def _run(self, poller: _ThreadPoller) -> None:
+        diff = _ThreadDiff()
+        deadline = time.monotonic() + self.max_duration
+        baseline_taken = False
+        run_active = False
+        idle = 0
+        try:
+            while poller.subscribers and time.monotonic() < deadline:
+                try:
+                    payload = await self.fetch_state(poller.thread_id)
+                except Exception as exc:  # noqa: BLE001
+                    logger.warning("State stream poll failed for %s: %s", poller.thread_id, exc)
+                    payload = None
+
+                if payload is not None:
+                    poller.last_snapshot = payload
+                    delta = diff.apply(payload)
+                    if not baseline_taken:
+                        # On a follow-up turn the thread still holds the previous output;
+                        # only a different output (or a run finishing) ends the stream
+                        baseline_taken = True
+                        poller.baseline_output = diff.output_key
+                        delta = _without_output(delta, poller.baseline_output)
+                    if delta:
+                        self._publish(poller, "delta", delta)
+
+                    status = payload.get("status")
+                    finished = run_active and status in TERMINAL_STATUSES
+                    if status and status not in TERMINAL_STATUSES:
+                        run_active = True
+                    if diff.output_key != poller.baseline_output or finished:
+                        self._publish(poller, "done", {"thread_id": poller.thread_id})
+                        return
+                    # Already finished when we joined and nothing is moving: no new run is coming
+                    idle = idle + 1 if not run_active and status in TERMINAL_STATUSES and not delta else 0
+                    if idle >= self.idle_polls:
+                        self._publish(poller, "done", {"thread_id": poller.thread_id, "reason": "idle"})
+                        return
+
+                await asyncio.sleep(self.interval)
+
+            if poller.subscribers:
+                self._publish(poller, "done", {"thread_id": poller.thread_id, "reason": "timeout"})
+        finally:
+            self._pollers.pop(poller.thread_id, None)
+
+    async def subscribe(self, thread_id: str) -> AsyncIterator[str]:
+        """Yield SSE frames for ``thread_id`` until the thread finishes or the client leaves."""
+        queue: asyncio.Queue = asyncio.Queue()
+        poller = self._poller_for(thread_id)
+        poller.subscribers.add(queue)
+
+        if poller.last_snapshot is not None:
+            # Late joiners get everything the shared poller has already pushed.
+            snapshot = _without_output(_ThreadDiff().apply(poller.last_snapshot), poller.baseline_output)
+            if snapshot:
+                queue.put_nowait(("delta", snapshot))
+
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+                if event == "done":
+                    return
+        finally:
+            poller.subscribers.discard(queue)
+
+    async def shutdown(self) -> None:
+        """Cancel every running poller."""
+        tasks = [poller.task for poller in self._pollers.values() if poller.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pollers.clear()
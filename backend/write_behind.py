@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+MODE_BUFFERED = "buffered"
+MODE_ACK = "ack"
+
+_STOP = object()
+
+class WriteBehindBuffer:
+    """
+    Batches MongoDB writes off the request path.
+
+    In ``buffered`` mode writes are queued and flushed as one ``bulk_write``
+    per collection whenever ``batch_size`` operations are pending or
+    ``flush_interval`` seconds have passed. ``write`` blocks (backpressure)
+    while ``max_pending`` operations are waiting. In ``ack`` mode every write
+    is awaited before returning, i.e. acknowledged before the response is sent.
+
+    Parameters
+    ----------
+    db:
+        Motor database handle.
+    mode:
+        ``buffered`` or ``ack``.
+    batch_size:
+        Flush as soon as this many operations are pending.
+    flush_interval:
+        Maximum seconds an operation waits in the buffer.
+    max_pending:
+        Queue bound; producers wait once it is reached.
+    max_retries:
+        Retries for a batch that fails with a transient (non bulk-write) error.
+    """
+
+    def __init__(
+        self,
+        db,
+        mode: str = MODE_BUFFERED,
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        max_pending: int = 10000,
+        max_retries: int = 3,
+    ) -> None:
+        self.db = db
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._task is None and self.mode == MODE_BUFFERED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still buffered and stop the background flusher."""
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+        while not self._queue.empty():
+            await self._flush(self._drain(self._queue.qsize()))
+
+    async def write(self, collection: str, operation: Any) -> None:
+        """Queue (or, in ack mode, perform) a pymongo write operation."""
+        if self.mode == MODE_ACK:
+            await self.db[collection].bulk_write([operation])
+            return
+        self.start()
+        await self._queue.put((collection, operation))
+
+    async def insert(self, collection: str, document: Dict[str, Any]) -> None:
+        await self.write(collection, InsertOne(document))
+
+    async def update(self, collection: str, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> None:
+        await self.write(collection, UpdateOne(filter, update, upsert=upsert))
+
+    def _drain(self, limit: int) -> List[Tuple[str, Any]]:
+        items = []
+        while len(items) < limit and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, Any]]) -> None:
+        by_collection: Dict[str, List[Any]] = defaultdict(list)
+        for collection, operation in batch:
+            by_collection[collection].append(operation)
+
+        for collection, operations in by_collection.items():
+            # Ordered so updates to the same document apply in arrival order;
+            # a failing operation is logged and skipped, the rest retried.
+            attempt = 0
+            while operations:
+                try:
+                    await self.db[collection].bulk_write(operations, ordered=True)
+                    break
+                except BulkWriteError as exc:
+                    errors = exc.details.get("writeErrors") or [{"index": len(operations) - 1}]
+                    failed = errors[0]["index"]
+                    logger.error("Dropping buffered %s write: %s", collection, errors[0].get("errmsg", exc))
+                    operations = operations[failed + 1:]
+                except Exception as exc:  # noqa: BLE001
+                    if attempt >= self.max_retries:
+                        logger.error("Dropping %d buffered %s writes: %s", len(operations), collection, exc)
+                        break
+                    attempt += 1
+                    logger.warning("Flush of %d %s writes failed (%s); retrying", len(operations), collection, exc)
+                    await asyncio.sleep(0.5 * 2 ** attempt)
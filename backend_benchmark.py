@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Backend Performance Benchmarks for Sagent AI
+Regression benchmarks for latency-sensitive backend paths
+
+Usage:
+    python backend_benchmark.py                 # run every benchmark
+    python backend_benchmark.py auth_isolation  # run a single benchmark
+
+Benchmarks that hit the API use BACKEND_URL; in-process ones import from backend/.
+
+auth_isolation serves a deliberately slow Emergent Auth stub on EMERGENT_AUTH_URL
+(a localhost URL); start the backend with the same EMERGENT_AUTH_URL, e.g.
+
+    EMERGENT_AUTH_URL=http://127.0.0.1:8765/session-data uvicorn server:app --port 8001
+    EMERGENT_AUTH_URL=http://127.0.0.1:8765/session-data python backend_benchmark.py auth_isolation
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import string
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+# Configuration
+BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8001/api")
+BACKEND_DIR = Path(__file__).parent / "backend"
+EMERGENT_AUTH_URL = os.environ.get("EMERGENT_AUTH_URL", "")
+AUTH_STUB_DELAY = float(os.environ.get("AUTH_STUB_DELAY", "5"))
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def print_latencies(label: str, samples_ms: List[float]):
+    """Print a one-line latency summary"""
+    print(
+        f"   {label:<28} n={len(samples_ms):<5} "
+        f"p50={percentile(samples_ms, 50):8.2f}ms "
+        f"p95={percentile(samples_ms, 95):8.2f}ms "
+        f"p99={percentile(samples_ms, 99):8.2f}ms "
+        f"mean={statistics.fmean(samples_ms) if samples_ms else 0:8.2f}ms"
+    )
+
+def time_requests(method: str, url: str, count: int, **kwargs) -> List[float]:
+    """Issue `count` sequential requests and return latencies in ms"""
+    samples = []
+    with requests.Session() as session:
+        for _ in range(count):
+            start = time.perf_counter()
+            session.request(method, url, timeout=30, **kwargs)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+class SlowAuthStub:
+    """Local stand-in for Emergent Auth that answers every exchange after `delay` seconds"""
+
+    def __init__(self, url: str, delay: float):
+        parsed = urlparse(url)
+        if parsed.hostname not in ("localhost", "127.0.0.1") or not parsed.port:
+            raise ValueError(f"EMERGENT_AUTH_URL must be a localhost URL with a port, got {url!r}")
+        self.delay = delay
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                self.send_response(401)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((parsed.hostname, parsed.port), Handler)
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "SlowAuthStub":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+def auth_stub_url() -> Optional[str]:
+    """EMERGENT_AUTH_URL if it is safe to load, else None (never the production auth host)"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from emergent_auth import EMERGENT_SESSION_DATA_URL
+
+    if not EMERGENT_AUTH_URL or EMERGENT_AUTH_URL == EMERGENT_SESSION_DATA_URL:
+        print("   ⚠️  Refusing to run: set EMERGENT_AUTH_URL to a localhost URL for the slow auth stub")
+        print("       and start the backend with the same value (see the module docstring).")
+        return None
+    return EMERGENT_AUTH_URL
+
+# ===== BENCHMARKS =====
+
+def bench_auth_isolation(samples: int = 200, concurrent_logins: int = 32) -> bool:
+    """/api/agents latency must stay flat while session-data exchanges are in flight"""
+    print("\n" + "="*80)
+    print("BENCHMARK: /api/agents latency with concurrent logins")
+    print("="*80)
+
+    stub_url = auth_stub_url()
+    if stub_url is None:
+        return False
+
+    agents_url = f"{BACKEND_URL}/agents"
+    login_url = f"{BACKEND_URL}/auth/session-data"
+
+    baseline = time_requests("GET", agents_url, samples)
+    print_latencies("idle", baseline)
+
+    stop = threading.Event()
+    login_count = [0]
+
+    def login_loop():
+        with requests.Session() as session:
+            while not stop.is_set():
+                try:
+                    session.post(login_url, headers={"X-Session-ID": str(uuid.uuid4())}, timeout=30)
+                except requests.RequestException:
+                    pass
+                login_count[0] += 1
+
+    with SlowAuthStub(stub_url, AUTH_STUB_DELAY) as stub:
+        with ThreadPoolExecutor(max_workers=concurrent_logins) as pool:
+            for _ in range(concurrent_logins):
+                pool.submit(login_loop)
+            time.sleep(1.0)
+            loaded = time_requests("GET", agents_url, samples)
+            stop.set()
+
+    print_latencies(f"{concurrent_logins} logins in flight", loaded)
+    print(f"   login exchanges issued: {login_count[0]}, reached the {AUTH_STUB_DELAY:g}s auth stub: {stub.hits}")
+    if not stub.hits:
+        print("   ❌ FAIL: the backend never called the stub; is it running with the same EMERGENT_AUTH_URL?")
+        return False
+
+    baseline_p95 = percentile(baseline, 95)
+    loaded_p95 = percentile(loaded, 95)
+    # Allow some noise, but a blocked event loop shows up as a multi-x jump
+    passed = loaded_p95 <= max(baseline_p95 * 2, baseline_p95 + 25)
+    print(f"   {'✅ PASS' if passed else '❌ FAIL'}: p95 {baseline_p95:.2f}ms -> {loaded_p95:.2f}ms")
+    return passed
+
+def make_research_payload(target_bytes: int = 1_000_000) -> Dict[str, Any]:
+    """Build a DeepAgents-shaped execute response of roughly `target_bytes`"""
+    rng = random.Random(42)
+
+    def text(words: int) -> str:
+        return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(words))
+
+    sources = []
+    messages = []
+    size = 0
+    while size < target_bytes:
+        source = {"title": text(8), "url": f"https://example.com/{uuid.uuid4()}", "snippet": text(60)}
+        message = {"type": "ai", "id": str(uuid.uuid4()), "content": text(120), "tool_calls": [], "score": rng.random()}
+        sources.append(source)
+        messages.append(message)
+        size += len(str(source)) + len(str(message))
+
+    thread_id = str(uuid.uuid4())
+    raw = {
+        "thread_id": thread_id,
+        "agent_name": "smart_router",
+        "result": text(400),
+        "source": sources,
+        "state": {"channels": {"messages": messages}},
+        "created_at": datetime.now(timezone.utc),
+    }
+    return {
+        "thread_id": thread_id,
+        "agent_name": "smart_router",
+        "result": raw["result"],
+        "sources": sources,
+        "raw_response": raw,
+    }
+
+def bench_serialization(iterations: int = 30) -> bool:
+    """Per-request serialization cost of a ~1 MB research response (in-process)"""
+    print("\n" + "="*80)
+    print("BENCHMARK: JSON serialization of ~1 MB research responses")
+    print("="*80)
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fast_json import HAS_ORJSON, FastJSONResponse
+
+    payload = make_research_payload()
+
+    def default_path():
+        return JSONResponse(jsonable_encoder(payload)).body
+
+    def fast_path():
+        return FastJSONResponse(payload).body
+
+    results = {}
+    for label, render in (("jsonable_encoder + json", default_path), ("FastJSONResponse", fast_path)):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            body = render()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[label] = samples
+        print_latencies(f"{label} ({len(body) / 1e6:.2f} MB)", samples)
+
+    default_p50 = percentile(results["jsonable_encoder + json"], 50)
+    fast_p50 = percentile(results["FastJSONResponse"], 50)
+    print(f"   orjson available: {HAS_ORJSON}")
+    passed = fast_p50 < default_p50
+    print(f"   {'✅ PASS' if passed else '❌ FAIL'}: p50 {default_p50:.2f}ms -> {fast_p50:.2f}ms ({default_p50 / max(fast_p50, 1e-9):.1f}x)")
+    return passed
+
+def make_research_queries(count: int, seed: int = 7) -> List[str]:
+    """Synthetic research questions built from a small topic vocabulary"""
+    rng = random.Random(seed)
+    templates = [
+        "What is the market size of {a} in {r}?",
+        "Latest research on {a} and {b}",
+        "Who are the leading companies in {a} in {r}?",
+        "Compare {a} with {b} for {r}",
+        "Growth forecast for {a} {r} {y}",
+    ]
+    topics = [
+        "electric vehicles", "solar panels", "protein folding", "quantum computing", "battery recycling",
+        "carbon capture", "gene therapy", "edge computing", "vertical farming", "satellite internet",
+        "semiconductors", "wind turbines", "mRNA vaccines", "robotic surgery", "hydrogen fuel",
+    ]
+    regions = ["Europe", "Asia", "India", "the US", "Latin America", "Africa", "Japan", "Germany"]
+    return [
+        rng.choice(templates).format(
+            a=rng.choice(topics), b=rng.choice(topics), r=rng.choice(regions), y=rng.randint(2020, 2035)
+        )
+        for _ in range(count)
+    ]
+
+def bench_semantic_lookup(sizes=(100_000, 1_000_000), lookups: int = 200) -> bool:
+    """Near-duplicate query lookup latency (embed + brute-force search) at scale (in-process)"""
+    print("\n" + "="*80)
+    print("BENCHMARK: Semantic cache lookup latency")
+    print("="*80)
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import numpy as np
+    from semantic_cache import HashedNgramVectorizer, VectorIndex
+
+    vectorizer = HashedNgramVectorizer(int(os.environ.get("SEMANTIC_CACHE_DIM", "256")))
+    # Embed a pool of distinct queries and tile it up to each index size
+    pool = make_research_queries(20_000)
+    start = time.perf_counter()
+    pool_vectors = np.stack([vectorizer.transform(query) for query in pool])
+    embed_us = (time.perf_counter() - start) / len(pool) * 1e6
+    print(f"   embedding: {embed_us:.1f}us/query, dim={vectorizer.dim}")
+
+    budgets_ms = {100_000: 25.0, 1_000_000: 250.0}
+    probes = make_research_queries(lookups, seed=11)
+    passed = True
+    for size in sizes:
+        index = VectorIndex(vectorizer.dim, size)
+        repeats = -(-size // len(pool))
+        index.extend(np.tile(pool_vectors, (repeats, 1))[:size], [None] * size)
+
+        samples = []
+        for query in probes:
+            start = time.perf_counter()
+            index.search(vectorizer.transform(query), 5)
+            samples.append((time.perf_counter() - start) * 1000)
+        print_latencies(f"{size:,} stored ({index.nbytes / 1e6:.0f} MB)", samples)
+
+        budget = budgets_ms.get(size)
+        if budget is not None:
+            p95 = percentile(samples, 95)
+            ok = p95 <= budget
+            passed = passed and ok
+            print(f"   {'✅ PASS' if ok else '❌ FAIL'}: p95 {p95:.2f}ms (budget {budget:.0f}ms)")
+        del index
+    return passed
+
+BENCHMARKS: Dict[str, Callable[[], bool]] = {
+    "auth_isolation": bench_auth_isolation,
+    "serialization": bench_serialization,
+    "semantic_lookup": bench_semantic_lookup,
+}
+
+def main():
+    """Run the selected benchmarks"""
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+        sys.exit(2)
+
+    print("="*80)
+    print("SAGENT AI - BACKEND BENCHMARKS")
+    print("="*80)
+    print(f"Backend URL: {BACKEND_URL}")
+
+    results = {name: BENCHMARKS[name]() for name in selected}
+    failed = [name for name, passed in results.items() if not passed]
+
+    print("\n" + "="*80)
+    print("❌ REGRESSIONS: " + ", ".join(failed) if failed else "✅ ALL BENCHMARKS WITHIN BUDGET")
+    print("="*80)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@ import { Input } from '@/components/ui/input.jsx';
 import { Switch } from '@/components/ui/switch.jsx';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select.jsx';
 import { toast } from 'sonner';
-import { previewAgentChain, getChatHistory, deepagentChat, deepagentState } from '@/utils/api.js';
+import { previewAgentChain, getChatHistory, getMessageResponse, deepagentChat, deepagentState } from '@/utils/api.js';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import { v4 as uuidv4 } from 'uuid';
@@ -496,15 +496,23 @@ export default function ChatInterface() {
   // Preview agent chain as user types (debounced)
   useEffect(() => {
     if (query.trim().length > 15) {
+      const controller = new AbortController();
       const debounce = setTimeout(async () => {
         try {
-          const response = await previewAgentChain({ query, personalized });
-          setAgentChain(response.data.agent_chain || []);
+          const response = await previewAgentChain({ query, personalized }, { signal: controller.signal });
+          if (response.status !== 204) {
+            setAgentChain(response.data.agent_chain || []);
+          }
         } catch (error) {
-          console.error('Preview error:', error);
+          if (error.code !== 'ERR_CANCELED') {
+            console.error('Preview error:', error);
+          }
         }
       }, 800);
-      return () => clearTimeout(debounce);
+      return () => {
+        clearTimeout(debounce);
+        controller.abort();
+      };
     } else {
       setAgentChain([]);
     }
@@ -546,6 +554,30 @@ export default function ChatInterface() {
     }
   };
 
+  // History only carries a short preview of large (offloaded) responses; fetch full bodies when a thread is opened
+  const loadOffloadedResponses = async (thread) => {
+    const offloaded = (thread.messages || []).filter(msg => msg.response?.offloaded);
+    if (!offloaded.length) return;
+
+    const loaded = {};
+    await Promise.all(offloaded.map(async (msg) => {
+      try {
+        const response = await getMessageResponse(msg.id);
+        loaded[msg.id] = response.data;
+      } catch (error) {
+        console.error('Failed to load full response:', error);
+      }
+    }));
+    if (!Object.keys(loaded).length) return;
+
+    const withLoaded = (t) => (t && t.id === thread.id ? {
+      ...t,
+      messages: t.messages.map(msg => (loaded[msg.id] ? { ...msg, response: loaded[msg.id] } : msg))
+    } : t);
+    setThreads(prev => prev.map(withLoaded));
+    setCurrentThread(prev => withLoaded(prev));
+  };
+
   const createNewThread = () => {
     setCurrentThread(null);
     setQuery('');
@@ -1029,6 +1061,7 @@ export default function ChatInterface() {
                       onClick={() => {
                         setCurrentThread(thread);
                         setActiveThreadId(thread.id);
+                        loadOffloadedResponses(thread);
                       }}
                       className="w-full text-left p-3"
                       data-testid={`thread-${thread.id}`}
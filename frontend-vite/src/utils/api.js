@@ -42,16 +42,30 @@ export const subscribeAgent = (agentId) => api.post(`/agents/${agentId}/subscrib
 export const unsubscribeAgent = (agentId) => api.delete(`/agents/${agentId}/unsubscribe`);
 
 // Chat
-export const previewAgentChain = (query) => api.post('/chat/preview', query);
+// Pass { signal } to abort a superseded preview; a 204 means a newer one replaced it
+export const previewAgentChain = (query, config) => api.post('/chat/preview', query, config);
 
 export const executeChatQuery = (request) => api.post('/chat/execute', request);
 
 export const getChatHistory = (limit = 50) => api.get('/chat/history', { params: { limit } });
 
+// Full DeepAgents response for a history message (large ones are stored out of line)
+export const getMessageResponse = (messageId) => api.get(`/chat/message/${messageId}/response`);
+
 export const deepagentChat = (payload) => api.post('/chat/execute', payload);
 
+// Background chat jobs: submit returns { job_id } immediately, poll getChatJob for the result
+export const submitChatJob = (payload) => api.post('/chat/jobs', payload);
+
+export const getChatJob = (jobId) => api.get(`/chat/jobs/${jobId}`);
+
+export const cancelChatJob = (jobId) => api.delete(`/chat/jobs/${jobId}`);
+
 export const deepagentState = (threadId) => api.get(`/chat/state/${threadId}`);
 
+// Server-Sent Events stream of state deltas; listen for 'delta' and 'done' events
+export const deepagentStateStream = (threadId) => new EventSource(`${API_URL}/chat/state/${threadId}/stream`);
+
 // Analytics
 export const getAnalytics = () => api.get('/analytics');
 
@@ -0,0 +1,146 @@
+"""Minimal in-memory stand-in for the Motor collection calls the backend makes."""
+import copy
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from pymongo.errors import DuplicateKeyError
+
+def _matches_value(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for op, arg in condition.items():
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$lt" and (value is None or not value < arg):
+                return False
+            if op == "$lte" and (value is None or not value <= arg):
+                return False
+            if op == "$gt" and (value is None or not value > arg):
+                return False
+            if op == "$gte" and (value is None or not value >= arg):
+                return False
+        return True
+    return value == condition
+
+def matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif not _matches_value(doc.get(key), condition):
+            return False
+    return True
+
+def project(doc: Dict[str, Any], projection: Any) -> Dict[str, Any]:
+    if not projection:
+        return doc
+    included = [key for key, flag in projection.items() if flag and key != "_id"]
+    if included:
+        keep = set(included) | ({"_id"} if projection.get("_id", 1) else set())
+        return {key: value for key, value in doc.items() if key in keep}
+    return {key: value for key, value in doc.items() if key not in projection}
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict[str, Any]]) -> None:
+        self._docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def sort(self, keys, direction: int = 1) -> "FakeCursor":
+        if isinstance(keys, str):
+            keys = [(keys, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: doc.get(field), reverse=order < 0)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._docs)
+
+class FakeCollection:
+    def __init__(self) -> None:
+        self.docs: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def _apply(doc: Dict[str, Any], update: Dict[str, Any]) -> None:
+        for key, value in update.get("$set", {}).items():
+            doc[key] = value
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+
+    async def insert_one(self, doc: Dict[str, Any]):
+        self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=len(self.docs))
+
+    async def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True):
+        for doc in docs:
+            await self.insert_one(doc)
+        return SimpleNamespace(inserted_ids=list(range(len(docs))))
+
+    async def find_one(self, query: Dict[str, Any], projection: Any = None):
+        for doc in self.docs:
+            if matches(doc, query):
+                return project(copy.deepcopy(doc), projection)
+        return None
+
+    def find(self, query: Dict[str, Any], projection: Any = None) -> FakeCursor:
+        return FakeCursor([project(copy.deepcopy(doc), projection) for doc in self.docs if matches(doc, query)])
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        for doc in self.docs:
+            if matches(doc, query):
+                self._apply(doc, update)
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+            if "_id" in doc and any(existing.get("_id") == doc["_id"] for existing in self.docs):
+                raise DuplicateKeyError("E11000 duplicate key error")
+            self._apply(doc, update)
+            doc.update(update.get("$setOnInsert", {}))
+            self.docs.append(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc.get("_id"))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query: Dict[str, Any], update: Dict[str, Any]):
+        hits = [doc for doc in self.docs if matches(doc, query)]
+        for doc in hits:
+            self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(hits), modified_count=len(hits))
+
+    async def count_documents(self, query: Dict[str, Any]) -> int:
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def delete_many(self, query: Dict[str, Any]):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def delete_one(self, query: Dict[str, Any]):
+        for index, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[index]
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+class FakeDatabase:
+    def __init__(self) -> None:
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self._collections.setdefault(name, FakeCollection())
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import admission
+from admission import (
+    GLOBAL_KEY,
+    AdmissionController,
+    AdmissionLimits,
+    AdmissionRejected,
+    LocalAdmissionBackend,
+    MongoAdmissionBackend,
+)
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+def _controller(backend=None, **limits):
+    limits = {"rate_per_second": 100.0, "burst": 100, "max_inflight_per_user": 1, "max_inflight_global": 10, **limits}
+    return AdmissionController(backend or LocalAdmissionBackend(), AdmissionLimits(**limits), queue_timeout=1.0, retry_interval=0.01)
+
+async def test_rate_limit_rejects_with_retry_after():
+    controller = _controller(rate_per_second=0.5, burst=1)
+    await controller.check_rate("user-1")
+    with pytest.raises(AdmissionRejected) as excinfo:
+        await controller.check_rate("user-1")
+    assert excinfo.value.retry_after >= 1
+
+async def test_queued_request_gets_the_released_slot():
+    controller = _controller()
+    order = []
+    release_first = asyncio.Event()
+
+    async def first():
+        async with controller.admit("user-1"):
+            order.append("first")
+            await release_first.wait()
+
+    async def second():
+        async with controller.admit("user-1"):
+            order.append("second")
+
+    task = asyncio.create_task(first())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(second())
+    await asyncio.sleep(0.05)
+    assert order == ["first"]
+
+    release_first.set()
+    await asyncio.gather(task, waiter)
+    assert order == ["first", "second"]
+    assert controller.backend._inflight == {}
+
+async def test_busy_user_does_not_block_other_users():
+    controller = _controller()
+    hold = asyncio.Event()
+
+    async def busy():
+        async with controller.admit("busy"):
+            await hold.wait()
+
+    tasks = [asyncio.create_task(busy()) for _ in range(2)]
+    await asyncio.sleep(0)
+    async with controller.admit("other"):
+        pass
+    hold.set()
+    await asyncio.gather(*tasks)
+
+async def test_queue_timeout_rejects():
+    controller = _controller()
+    controller.queue_timeout = 0.05
+    hold = asyncio.Event()
+
+    async def holder():
+        async with controller.admit("user-1"):
+            await hold.wait()
+
+    task = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected):
+        async with controller.admit("user-1"):
+            pass
+    hold.set()
+    await task
+    assert controller.backend._inflight == {}
+
+async def test_slot_granted_as_the_wait_times_out_is_released(monkeypatch):
+    backend = LocalAdmissionBackend()
+    controller = _controller(backend, max_inflight_per_user=2)
+    await backend.try_acquire("user-1", controller.limits)
+    await backend.try_acquire("user-1", controller.limits)
+
+    async def granted_then_timed_out(awaitable, timeout):
+        # The dispatcher hands over a slot in the same instant the wait expires
+        await backend.release("user-1")
+        _, future = controller._waiters[-1]
+        future.set_result(await backend.try_acquire("user-1", controller.limits))
+        awaitable.cancel()
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(admission.asyncio, "wait_for", granted_then_timed_out)
+    with pytest.raises(AdmissionRejected):
+        await controller._acquire_slot("user-1")
+    assert backend._inflight == {"user-1": 1, GLOBAL_KEY: 1}
+
+async def test_mongo_leases_are_shared_and_lapse_individually():
+    db = FakeDatabase()
+    limits = AdmissionLimits(max_inflight_per_user=1, max_inflight_global=10)
+    worker_a = MongoAdmissionBackend(db, lease_ttl=60)
+    worker_b = MongoAdmissionBackend(db, lease_ttl=60)
+    try:
+        lease = await worker_a.try_acquire("user-1", limits)
+        assert lease is not None
+        assert await worker_b.try_acquire("user-1", limits) is None
+        assert await worker_b.try_acquire("user-2", limits) is not None
+
+        # Worker A dies: its leases stop being renewed and lapse
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await db.admission.update_many({"worker": worker_a.worker_id}, {"$set": {"expires_at": past}})
+        taken_over = await worker_b.try_acquire("user-1", limits)
+        assert taken_over == lease
+
+        # A late release from the dead worker must not free worker B's slot
+        await worker_a.release(lease)
+        assert await db.admission.count_documents({"worker": worker_b.worker_id}) == 4
+    finally:
+        await worker_a.stop()
+        await worker_b.stop()
+
+async def test_mongo_global_limit_returns_user_slot():
+    db = FakeDatabase()
+    limits = AdmissionLimits(max_inflight_per_user=5, max_inflight_global=1)
+    backend = MongoAdmissionBackend(db)
+    try:
+        assert await backend.try_acquire("user-1", limits) is not None
+        assert await backend.try_acquire("user-2", limits) is None
+        assert await db.admission.count_documents({"key": "user-2"}) == 0
+    finally:
+        await backend.stop()
@@ -0,0 +1,72 @@
+from agent_router import AgentRouter, tokenize
+
+def _agent(agent_id, description, categories, cost=0.01, name=None):
+    return {
+        "id": agent_id, "name": name or agent_id, "description": description,
+        "categories": categories, "cost_per_query": cost,
+    }
+
+CATALOG = [
+    _agent("people_finder", "Find executives and founders", ["People"]),
+    _agent("market_scout", "Competitor and pricing analysis", ["Market Research"]),
+    _agent("paper_search", "Search academic literature", ["Scientific Research"]),
+]
+
+def _router(agents=CATALOG, version="v1"):
+    router = AgentRouter("smart_router")
+    router.build(agents, version)
+    return router
+
+def test_tokenize_drops_stopwords_and_stems():
+    assert tokenize("Who are the founders of these companies?") == ["founder", "these", "company"]
+
+def test_rank_puts_the_best_matching_agent_first():
+    router = _router()
+    assert router.rank("who is the ceo of acme")[0]["agent_id"] == "people_finder"
+    assert router.rank("competitor pricing for acme")[0]["agent_id"] == "market_scout"
+    assert router.rank("clinical trial papers on protein folding")[0]["agent_id"] == "paper_search"
+
+def test_rank_breaks_score_ties_by_cost():
+    router = _router([
+        _agent("pricey", "Company research", ["Market Research"], cost=0.05, name="scout"),
+        _agent("cheap", "Company research", ["Market Research"], cost=0.01, name="scout"),
+    ])
+    ranked = router.rank("market size of electric bikes")
+    assert [entry["agent_id"] for entry in ranked] == ["cheap", "pricey"]
+    assert ranked[0]["score"] == ranked[1]["score"]
+
+def test_rank_leaves_out_unrelated_agents_and_caps_the_chain():
+    router = _router()
+    assert router.rank("zzz qqq") == []
+
+    crowded = [_agent(f"people_{i}", "Find founders", ["People"]) for i in range(5)]
+    assert len(_router(crowded).rank("founder of acme")) == router.max_chain
+
+def test_preview_falls_back_to_the_default_agent():
+    preview = _router().preview("zzz qqq")
+    assert preview["agent_chain"] == [{
+        "agent_id": "smart_router",
+        "agent_name": "smart_router",
+        "purpose": "Routed via DeepAgents smart router",
+    }]
+    assert preview["estimated_cost"] == 0.0
+    assert preview["routing"]["catalog_version"] == "v1"
+
+def test_preview_sums_the_chain_cost():
+    preview = _router().preview("ceo and founder background")
+    assert preview["agent_chain"][0]["agent_id"] == "people_finder"
+    assert preview["estimated_cost"] == round(sum(entry["cost_per_query"] for entry in preview["agent_chain"]), 4)
+
+def test_ensure_current_rebuilds_only_when_the_etag_changes():
+    router = _router(CATALOG[:1], version="v1")
+    router.ensure_current(CATALOG, "v1")
+    assert router.rank("clinical trial papers") == []
+
+    router.ensure_current(CATALOG, "v2")
+    assert router.version == "v2"
+    assert router.rank("clinical trial papers")[0]["agent_id"] == "paper_search"
+
+def test_ensure_current_builds_an_empty_index():
+    router = AgentRouter("smart_router")
+    router.ensure_current(CATALOG, None)
+    assert router.rank("who is the ceo of acme")[0]["agent_id"] == "people_finder"
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import analytics_rollups
+from analytics_rollups import rebuild_rollups, rollup_updates
+
+from .fake_mongo import FakeCursor, FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+def _evaluate(expr, doc):
+    """Just enough of the aggregation expression language for the rebuild pipeline."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = doc
+        for part in expr[1:].split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    if isinstance(expr, dict) and len(expr) == 1 and next(iter(expr)).startswith("$"):
+        op, arg = next(iter(expr.items()))
+        if op == "$literal":
+            return arg
+        if op == "$cond":
+            return _evaluate(arg[1] if _evaluate(arg[0], doc) else arg[2], doc)
+        args = [_evaluate(item, doc) for item in arg] if isinstance(arg, list) else _evaluate(arg, doc)
+        if op == "$concat":
+            return "".join(args)
+        if op == "$toString":
+            return str(args)
+        if op == "$ifNull":
+            return args[1] if args[0] is None else args[0]
+        if op == "$type":
+            return "date" if isinstance(args, datetime) else "string"
+        if op == "$eq":
+            return args[0] == args[1]
+        if op == "$substrCP":
+            return args[0][args[1]:args[1] + args[2]]
+        if op == "$dateToString":
+            return args["date"].strftime(args["format"])
+        raise NotImplementedError(op)
+    if isinstance(expr, dict):
+        return {key: _evaluate(value, doc) for key, value in expr.items()}
+    return expr
+
+class AggregatingDatabase(FakeDatabase):
+    def __init__(self, entries) -> None:
+        super().__init__()
+        self.entries = entries
+        self["analytics"].aggregate = self._aggregate
+
+    def _aggregate(self, pipeline, **kwargs):
+        docs = self.entries
+        merged = []
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$group":
+                groups = {}
+                for doc in docs:
+                    group_id = _evaluate(spec["_id"], doc)
+                    group = groups.setdefault(repr(sorted(group_id.items())), {"_id": group_id})
+                    for field, accumulator in spec.items():
+                        if field != "_id":
+                            group[field] = group.get(field, 0) + _evaluate(accumulator["$sum"], doc)
+                docs = list(groups.values())
+            elif op == "$project":
+                docs = [
+                    {field: doc[field] if rule == 1 else _evaluate(rule, doc) for field, rule in spec.items() if rule != 0}
+                    for doc in docs
+                ]
+            elif op == "$merge":
+                target = self[spec["into"]]
+                for doc in docs:
+                    target.docs = [existing for existing in target.docs if existing["key"] != doc["key"]] + [doc]
+                merged = docs
+        return FakeCursor(merged)
+
+ENTRIES = [
+    {"user_id": "u1", "agent_name": "exa", "cost": 0.02, "tokens_used": 100, "timestamp": "2026-10-01T09:00:00+00:00"},
+    {"user_id": "u1", "agent_name": "exa", "cost": 0.02, "tokens_used": 50, "timestamp": datetime(2026, 10, 1, 18, tzinfo=timezone.utc)},
+    {"user_id": "u1", "agent_name": "linkup", "cost": 0.03, "timestamp": "2026-10-02T09:00:00+00:00"},
+    {"user_id": "u2", "agent_name": "exa", "cost": 0.02, "tokens_used": 10, "timestamp": "2026-10-02T10:00:00+00:00"},
+]
+
+def _normalized(docs):
+    return sorted(
+        ({**{k: v for k, v in doc.items() if k != "_id"}, "cost": round(doc["cost"], 6)} for doc in docs),
+        key=lambda doc: doc["key"],
+    )
+
+async def test_rebuild_matches_incremental_updates():
+    db = AggregatingDatabase(ENTRIES)
+    rollups = db[analytics_rollups.COLLECTION]
+    for entry in ENTRIES:
+        for rollup_filter, rollup_update in rollup_updates(entry):
+            await rollups.update_one(rollup_filter, rollup_update, upsert=True)
+    incremental = _normalized(rollups.docs)
+
+    assert await rebuild_rollups(db) == len(incremental)
+    assert _normalized(rollups.docs) == incremental
+    assert [doc["key"] for doc in incremental] == [
+        "agent:u1:exa", "agent:u1:linkup", "agent:u2:exa",
+        "day:u1:2026-10-01", "day:u1:2026-10-02", "day:u2:2026-10-02",
+        "user:u1", "user:u2",
+    ]
+
+async def test_rebuild_then_increment_does_not_double_count():
+    db = AggregatingDatabase(ENTRIES[:1])
+    rollups = db[analytics_rollups.COLLECTION]
+    await rebuild_rollups(db)
+    for rollup_filter, rollup_update in rollup_updates(ENTRIES[1]):
+        await rollups.update_one(rollup_filter, rollup_update, upsert=True)
+
+    user = next(doc for doc in rollups.docs if doc["key"] == "user:u1")
+    assert user["queries"] == 2
+    assert len(rollups.docs) == 3
@@ -0,0 +1,212 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from chat_jobs import (
+    STATUS_CANCELLED,
+    STATUS_COMPLETED,
+    STATUS_FAILED,
+    STATUS_QUEUED,
+    STATUS_RUNNING,
+    ChatJobManager,
+    _ago,
+)
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+def _job(job_id: str = "job-1", user_id: str = "user-1"):
+    return {"id": job_id, "user_id": user_id, "request": {"user_query": "hello"}}
+
+async def _status(db, job_id: str = "job-1"):
+    return (await db.chat_jobs.find_one({"id": job_id}))["status"]
+
+async def test_job_runs_to_completion_with_owner():
+    db = FakeDatabase()
+
+    async def runner(job):
+        return {"answer": job["request"]["user_query"]}
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-a")
+    await jobs.submit(_job())
+    await asyncio.gather(*jobs._tasks.values())
+
+    doc = await db.chat_jobs.find_one({"id": "job-1"})
+    assert doc["status"] == STATUS_COMPLETED
+    assert doc["owner"] == "worker-a"
+    assert doc["attempts"] == 1
+    assert doc["result"] == {"answer": "hello"}
+
+async def test_user_cancel_marks_cancelled():
+    db = FakeDatabase()
+    started = asyncio.Event()
+
+    async def runner(job):
+        started.set()
+        await asyncio.sleep(10)
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-a")
+    await jobs.submit(_job())
+    await started.wait()
+
+    assert await jobs.cancel("job-1", "user-1")
+    assert await _status(db) == STATUS_CANCELLED
+
+async def test_shutdown_requeues_instead_of_cancelling():
+    db = FakeDatabase()
+    started = asyncio.Event()
+
+    async def runner(job):
+        started.set()
+        await asyncio.sleep(10)
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-a")
+    await jobs.submit(_job())
+    await started.wait()
+    await jobs.shutdown()
+
+    doc = await db.chat_jobs.find_one({"id": "job-1"})
+    assert doc["status"] == STATUS_QUEUED
+    assert doc["owner"] is None
+
+    # Another worker picks the released job up and finishes it
+    async def finisher(job):
+        return {"answer": "done"}
+
+    other = ChatJobManager(db, finisher, worker_id="worker-b")
+    assert await other.reclaim() == 1
+    await asyncio.gather(*other._tasks.values())
+    doc = await db.chat_jobs.find_one({"id": "job-1"})
+    assert doc["status"] == STATUS_COMPLETED
+    assert doc["owner"] == "worker-b"
+    assert doc["attempts"] == 2
+
+async def test_stale_job_of_a_killed_worker_is_reclaimed():
+    db = FakeDatabase()
+    await db.chat_jobs.insert_one({
+        **_job(), "status": STATUS_RUNNING, "owner": "dead-worker", "heartbeat_at": _ago(600), "attempts": 1,
+    })
+    await db.chat_jobs.insert_one({
+        **_job("job-2"), "status": STATUS_RUNNING, "owner": "live-worker", "heartbeat_at": _ago(0), "attempts": 1,
+    })
+
+    async def runner(job):
+        return {"answer": "rerun"}
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-b", stale_after=60)
+    assert await jobs.reclaim() == 1
+    await asyncio.gather(*jobs._tasks.values())
+
+    assert await _status(db) == STATUS_COMPLETED
+    assert await _status(db, "job-2") == STATUS_RUNNING
+
+async def test_stale_job_out_of_attempts_is_failed():
+    db = FakeDatabase()
+    await db.chat_jobs.insert_one({
+        **_job(), "status": STATUS_RUNNING, "owner": "dead-worker", "heartbeat_at": _ago(600), "attempts": 2,
+    })
+
+    async def runner(job):
+        raise AssertionError("must not run again")
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-b", stale_after=60, max_attempts=2)
+    assert await jobs.reclaim() == 0
+    assert await _status(db) == STATUS_FAILED
+
+async def test_reclaimed_job_is_not_finished_by_the_old_owner():
+    db = FakeDatabase()
+    release = asyncio.Event()
+
+    async def slow(job):
+        await release.wait()
+        return {"answer": "late"}
+
+    jobs = ChatJobManager(db, slow, worker_id="worker-a")
+    await jobs.submit(_job())
+    await asyncio.sleep(0)
+    await db.chat_jobs.update_one({"id": "job-1"}, {"$set": {"owner": "worker-b"}})
+
+    release.set()
+    await asyncio.gather(*jobs._tasks.values())
+    assert await _status(db) == STATUS_RUNNING
+
+async def test_job_cancelled_through_another_worker_stops_locally():
+    db = FakeDatabase()
+    started = asyncio.Event()
+
+    async def runner(job):
+        started.set()
+        await asyncio.sleep(10)
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-a")
+    await jobs.submit(_job())
+    await started.wait()
+
+    other = ChatJobManager(db, runner, worker_id="worker-b")
+    assert await other.cancel("job-1", "user-1")
+    await jobs.beat()
+    await asyncio.gather(*jobs._tasks.values(), return_exceptions=True)
+
+    assert not jobs._tasks
+    assert await _status(db) == STATUS_CANCELLED
+
+async def test_get_hides_worker_bookkeeping():
+    db = FakeDatabase()
+
+    async def runner(job):
+        return {"answer": "ok"}
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-a")
+    await jobs.submit(_job())
+    await asyncio.gather(*jobs._tasks.values())
+
+    job = await jobs.get("job-1", "user-1")
+    assert job["status"] == STATUS_COMPLETED
+    assert not {"owner", "heartbeat_at", "attempts"} & set(job)
+
+async def test_job_waiting_for_admission_holds_no_permit():
+    db = FakeDatabase()
+    user_1_free = asyncio.Event()
+
+    @contextlib.asynccontextmanager
+    async def admit(job):
+        if job["user_id"] == "user-1":
+            await user_1_free.wait()
+        yield
+
+    async def runner(job):
+        return {"answer": job["user_id"]}
+
+    jobs = ChatJobManager(db, runner, max_concurrency=1, worker_id="worker-a", admit=admit)
+    await jobs.submit(_job("job-1", "user-1"))
+    await jobs.submit(_job("job-2", "user-2"))
+    await asyncio.gather(jobs._tasks["job-2"])
+
+    assert await _status(db, "job-2") == STATUS_COMPLETED
+    assert await _status(db, "job-1") == STATUS_QUEUED
+    user_1_free.set()
+    await asyncio.gather(*jobs._tasks.values())
+    assert await _status(db, "job-1") == STATUS_COMPLETED
+
+async def test_refused_admission_is_retried_not_failed():
+    db = FakeDatabase()
+    refusals = [RuntimeError("Timed out waiting for a free slot")]
+
+    @contextlib.asynccontextmanager
+    async def admit(job):
+        if refusals:
+            raise refusals.pop()
+        yield
+
+    async def runner(job):
+        return {"answer": "ok"}
+
+    jobs = ChatJobManager(db, runner, worker_id="worker-a", admit=admit, admission_retry=0)
+    await jobs.submit(_job())
+    await asyncio.gather(*jobs._tasks.values())
+
+    doc = await db.chat_jobs.find_one({"id": "job-1"})
+    assert doc["status"] == STATUS_COMPLETED
+    assert doc["attempts"] == 1
@@ -0,0 +1,108 @@
+import pytest
+
+from circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitOpenError, EndpointHealth
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("circuit_breaker.time.monotonic", lambda: now[0])
+    return now
+
+def _health(**options):
+    return EndpointHealth("state", **{"min_calls": 4, "error_threshold": 0.5, "open_seconds": 30.0, **options})
+
+def test_opens_once_the_error_rate_crosses_the_threshold(clock):
+    health = _health()
+    for success in (True, False, True):
+        health.record(success, 0.1)
+    assert health.state == STATE_CLOSED
+
+    health.record(False, 0.1)
+    assert health.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        health.before_call()
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+
+def test_half_open_lets_one_probe_through(clock):
+    health = _health()
+    for _ in range(4):
+        health.record(False, 0.1)
+
+    clock[0] += 30
+    assert health.state == STATE_HALF_OPEN
+    probe = health.before_call()
+    with pytest.raises(CircuitOpenError):
+        health.before_call()
+
+    health.record(True, 0.1, probe)
+    assert health.state == STATE_CLOSED
+
+def test_failed_probe_reopens(clock):
+    health = _health()
+    for _ in range(4):
+        health.record(False, 0.1)
+    clock[0] += 30
+    probe = health.before_call()
+    health.record(False, 0.1, probe)
+    assert health.state == STATE_OPEN
+
+def test_abandoned_probe_frees_the_slot(clock):
+    health = _health()
+    for _ in range(4):
+        health.record(False, 0.1)
+    clock[0] += 30
+    probe = health.before_call()
+    health.abandon(probe)
+    assert health.before_call() is not None
+
+def _half_open(clock):
+    health = _health()
+    for _ in range(4):
+        health.record(False, 0.1)
+    clock[0] += 30
+    return health
+
+def test_straggler_call_does_not_resolve_the_probe(clock):
+    health = _half_open(clock)
+    probe = health.before_call()
+    # A call issued before the circuit opened finishes now
+    health.record(True, 0.1)
+    assert health.state == STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        health.before_call()
+
+    health.record(False, 0.1, probe)
+    assert health.state == STATE_OPEN
+
+def test_losing_hedge_does_not_free_the_probe_slot(clock):
+    health = _half_open(clock)
+    probe = health.before_call()
+    health.abandon()
+    with pytest.raises(CircuitOpenError):
+        health.before_call()
+
+    # Only the current probe's token counts; an earlier one is stale
+    health.abandon(probe)
+    second = health.before_call()
+    health.abandon(probe)
+    health.record(True, 0.1, probe)
+    assert health.state == STATE_HALF_OPEN
+    health.record(True, 0.1, second)
+    assert health.state == STATE_CLOSED
+
+def test_old_calls_fall_out_of_the_window(clock):
+    health = _health(window_seconds=60)
+    for _ in range(3):
+        health.record(False, 0.1)
+    clock[0] += 61
+    health.record(False, 0.1)
+    assert health.state == STATE_CLOSED
+
+def test_latency_percentile_needs_min_calls(clock):
+    health = _health()
+    for latency in (0.1, 0.2, 0.3):
+        health.record(True, latency)
+    assert health.latency_percentile(99) is None
+    health.record(True, 0.4)
+    assert health.latency_percentile(99) == pytest.approx(0.4)
+    assert health.latency_percentile(50) == pytest.approx(0.2)
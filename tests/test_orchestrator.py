@@ -0,0 +1,134 @@
+import asyncio
+
+import httpx
+import pytest
+
+from agent_orchestrator import AgentOrchestrator
+
+pytestmark = pytest.mark.anyio
+
+def _orchestrator(handler, monkeypatch, **env):
+    monkeypatch.setenv("DEEPAGENTS_URL", "http://deepagents.test")
+    monkeypatch.delenv("DEEPAGENTS_URLS", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    orchestrator = AgentOrchestrator()
+    orchestrator._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return orchestrator
+
+async def test_concurrent_state_polls_share_one_request(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"status": "running"})
+
+    orchestrator = _orchestrator(handler, monkeypatch, DEEPAGENTS_STATE_CACHE_TTL="0")
+    results = await asyncio.gather(*(orchestrator.get_state("thread-1") for _ in range(10)))
+
+    assert calls == ["/api/v1/state/thread-1"]
+    assert all(result == {"status": "running"} for result in results)
+    await orchestrator.shutdown()
+
+async def test_state_is_reused_within_the_cache_ttl(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"status": "running"})
+
+    orchestrator = _orchestrator(handler, monkeypatch, DEEPAGENTS_STATE_CACHE_TTL="60")
+    await orchestrator.get_state("thread-1")
+    await orchestrator.get_state("thread-1")
+    await orchestrator.get_state("thread-2")
+
+    assert calls == ["/api/v1/state/thread-1", "/api/v1/state/thread-2"]
+    await orchestrator.shutdown()
+
+async def test_one_caller_leaving_does_not_cancel_the_shared_poll(monkeypatch):
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(200, json={"status": "done"})
+
+    orchestrator = _orchestrator(handler, monkeypatch, DEEPAGENTS_STATE_CACHE_TTL="0")
+    leaving = asyncio.create_task(orchestrator.get_state("thread-1"))
+    staying = asyncio.create_task(orchestrator.get_state("thread-1"))
+    await asyncio.sleep(0.01)
+    leaving.cancel()
+    release.set()
+
+    assert await staying == {"status": "done"}
+    await orchestrator.shutdown()
+
+async def test_open_state_circuit_serves_the_last_good_state(monkeypatch):
+    healthy = True
+
+    async def handler(request):
+        if healthy:
+            return httpx.Response(200, json={"status": "running"})
+        return httpx.Response(503)
+
+    orchestrator = _orchestrator(
+        handler, monkeypatch,
+        DEEPAGENTS_STATE_CACHE_TTL="0", DEEPAGENTS_BREAKER_MIN_CALLS="2", DEEPAGENTS_BREAKER_ERROR_RATE="0.5",
+    )
+    await orchestrator.get_state("thread-1")
+    healthy = False
+    # One success and one failure is a 50% error rate over the minimum two calls
+    with pytest.raises(httpx.HTTPStatusError):
+        await orchestrator.get_state("thread-1")
+
+    assert await orchestrator.get_state("thread-1") == {"status": "running", "stale": True}
+    await orchestrator.shutdown()
+
+async def test_calls_share_one_pooled_client(monkeypatch):
+    monkeypatch.setenv("DEEPAGENTS_URL", "http://deepagents.test")
+    monkeypatch.delenv("DEEPAGENTS_URLS", raising=False)
+    orchestrator = AgentOrchestrator()
+    await orchestrator.startup()
+    client = orchestrator.client
+    assert orchestrator.client is client
+
+    await orchestrator.shutdown()
+    assert client.is_closed
+    assert orchestrator._client is None
+
+def _two_replicas(monkeypatch, hedge_state=False):
+    hosts = []
+
+    async def handler(request):
+        hosts.append(request.url.host)
+        if request.url.host == "down.test":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"result": "ok"})
+
+    monkeypatch.setenv("DEEPAGENTS_URLS", "http://down.test,http://up.test")
+    monkeypatch.setenv("DEEPAGENTS_HEDGE_STATE", "true" if hedge_state else "false")
+    orchestrator = AgentOrchestrator()
+    orchestrator._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    down = next(replica for replica in orchestrator.pool.replicas if "down" in replica.base_url)
+    thread_id = next(f"t-{i}" for i in range(1000) if orchestrator.pool.owner(f"t-{i}") is down)
+    return orchestrator, thread_id, hosts
+
+async def test_new_thread_fails_over_to_the_next_replica(monkeypatch):
+    orchestrator, thread_id, hosts = _two_replicas(monkeypatch)
+    result = await orchestrator.send_chat({"thread_id": thread_id, "user_query": "hi"}, new_thread=True)
+    assert result == {"result": "ok"}
+    assert hosts == ["down.test", "up.test"]
+    await orchestrator.shutdown()
+
+async def test_existing_thread_does_not_fail_over_without_shared_state(monkeypatch):
+    orchestrator, thread_id, hosts = _two_replicas(monkeypatch)
+    with pytest.raises(httpx.ConnectError):
+        await orchestrator.send_chat({"thread_id": thread_id, "user_query": "and then?"})
+    assert hosts == ["down.test"]
+    await orchestrator.shutdown()
+
+async def test_existing_thread_fails_over_with_shared_state(monkeypatch):
+    orchestrator, thread_id, hosts = _two_replicas(monkeypatch, hedge_state=True)
+    assert await orchestrator.send_chat({"thread_id": thread_id, "user_query": "and then?"}) == {"result": "ok"}
+    assert hosts == ["down.test", "up.test"]
+    await orchestrator.shutdown()
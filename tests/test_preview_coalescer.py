@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from preview_coalescer import KeystrokeCoalescer
+
+pytestmark = pytest.mark.anyio
+
+async def _connected():
+    return False
+
+async def _disconnected():
+    return True
+
+async def test_only_the_latest_keystroke_of_a_burst_runs():
+    coalescer = KeystrokeCoalescer(window=0.02)
+
+    async def keystroke(delay):
+        await asyncio.sleep(delay)
+        return await coalescer.is_latest("client-1", _connected)
+
+    results = await asyncio.gather(*(keystroke(i * 0.005) for i in range(4)))
+    assert results == [False, False, False, True]
+    assert coalescer.superseded == 3
+
+async def test_clients_are_coalesced_independently():
+    coalescer = KeystrokeCoalescer(window=0.01)
+    results = await asyncio.gather(
+        coalescer.is_latest("client-1", _connected),
+        coalescer.is_latest("client-2", _connected),
+    )
+    assert results == [True, True]
+
+async def test_disconnected_client_is_skipped():
+    coalescer = KeystrokeCoalescer(window=0.01)
+    assert not await coalescer.is_latest("client-1", _disconnected)
+
+async def test_zero_window_disables_coalescing():
+    coalescer = KeystrokeCoalescer(window=0)
+    results = await asyncio.gather(*(coalescer.is_latest("client-1", _connected) for _ in range(3)))
+    assert results == [True, True, True]
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from response_cache import TIER_MEMORY, TIER_MONGO, ResponseCache, cache_key, normalize_query, parse_cache_control
+
+from .fake_mongo import FakeDatabase
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test")
+
+import server  # noqa: E402
+
+pytestmark = pytest.mark.anyio
+
+class DirectWriter:
+    """WriteBehindBuffer stand-in that applies updates to a fake database at once."""
+
+    def __init__(self, db) -> None:
+        self.db = db
+
+    async def update(self, collection, filter, update, upsert=False):
+        await self.db[collection].update_one(filter, update, upsert=upsert)
+
+def test_keys_ignore_case_whitespace_and_trailing_punctuation():
+    assert normalize_query("  Who is the CEO of  Acme? ") == "who is the ceo of acme"
+    assert cache_key("exa", "Who is the CEO of Acme?") == cache_key("exa", "who is the ceo of acme")
+    assert cache_key("exa", "acme") != cache_key("linkup", "acme")
+    assert cache_key("exa", "acme", "user-1") != cache_key("exa", "acme", "user-2")
+
+def test_cache_control_directives():
+    assert parse_cache_control(None) == (True, True)
+    assert parse_cache_control("no-cache") == (False, True)
+    assert parse_cache_control("no-cache, no-store") == (False, False)
+
+async def test_concurrent_misses_share_one_call():
+    db = FakeDatabase()
+    cache = ResponseCache(db, DirectWriter(db))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"result": "answer"}
+
+    results = await asyncio.gather(*(cache.fetch("key", compute) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert [joined for _, joined in results].count(False) == 1
+    assert all(payload == {"result": "answer"} for payload, _ in results)
+    payload, tier, _ = await cache.get("key")
+    assert (payload, tier) == ({"result": "answer"}, TIER_MEMORY)
+
+async def test_second_tier_serves_other_workers():
+    db = FakeDatabase()
+    await ResponseCache(db, DirectWriter(db)).set("key", {"result": "answer"})
+
+    other_worker = ResponseCache(db, DirectWriter(db))
+    payload, tier, _ = await other_worker.get("key")
+    assert (payload, tier) == ({"result": "answer"}, TIER_MONGO)
+
+@pytest.fixture
+def chat_server(monkeypatch):
+    db = FakeDatabase()
+    upstream = []
+
+    async def call_deepagents(agent_name, user_query, thread_id, new_thread=False):
+        upstream.append(user_query)
+        return {"agent_name": agent_name, "thread_id": thread_id, "result": f"answer {len(upstream)}"}
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "call_deepagents", call_deepagents)
+    monkeypatch.setattr(server, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(server, "SEMANTIC_CACHE_ENABLED", False)
+    monkeypatch.setattr(server, "response_cache", ResponseCache(db, DirectWriter(db)))
+    return db, upstream
+
+async def _fetch(query, thread_id):
+    request = server.ChatExecuteRequest(user_query=query, thread_id=thread_id)
+    thread = await server.find_thread("user-1", thread_id)
+    return await server.fetch_agent_payload(request, "user-1", "smart_router", thread_id, thread)
+
+async def test_client_thread_id_for_a_new_conversation_is_still_cached(chat_server):
+    _, upstream = chat_server
+    _, first = await _fetch("What is Acme's revenue?", "thread-a")
+    payload, second = await _fetch("what is acme's revenue", "thread-b")
+
+    assert first["status"] == "miss"
+    assert second["status"] == "hit"
+    assert second["context"] == "deferred"
+    assert payload["thread_id"] == "thread-b"
+    assert len(upstream) == 1
+
+async def test_follow_up_skips_the_cache(chat_server):
+    db, upstream = chat_server
+    await _fetch("What is Acme's revenue?", "thread-a")
+    await db.threads.insert_one({"thread_id": "thread-b", "user_id": "user-1", "message_count": 1})
+
+    _, report = await _fetch("What is Acme's revenue?", "thread-b")
+    assert report == {"status": "follow_up"}
+    assert len(upstream) == 2
+
+async def test_first_follow_up_after_a_hit_replays_the_cached_exchange(chat_server):
+    db, upstream = chat_server
+    await db.threads.insert_one({
+        "thread_id": "thread-b", "user_id": "user-1", "message_count": 1,
+        "pending_context": server.cached_exchange("What is Acme's revenue?", {"result": "About $5M."}),
+    })
+
+    _, report = await _fetch("And its growth?", "thread-b")
+    assert report == {"status": "follow_up", "context": "replayed"}
+    assert "What is Acme's revenue?" in upstream[-1]
+    assert "About $5M." in upstream[-1]
+    assert upstream[-1].endswith("And its growth?")
+
+async def test_thread_list_leaves_out_the_pending_context(chat_server):
+    db, _ = chat_server
+    await db.threads.insert_one({
+        "thread_id": "thread-b", "user_id": "demo-user-123", "message_count": 1, "last_activity": "2026-10-01",
+        "pending_context": server.cached_exchange("What is Acme's revenue?", {"result": "About $5M."}),
+    })
+
+    response = await server.list_chat_threads(authorization=None, session_token=None)
+    [thread] = json.loads(response.body)
+    assert thread["thread_id"] == "thread-b"
+    assert "pending_context" not in thread
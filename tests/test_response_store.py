@@ -0,0 +1,56 @@
+import pytest
+
+import response_store
+from response_store import LocalBlobStore, ResponseOffloader
+
+pytestmark = pytest.mark.anyio
+
+def _payload(result_chars):
+    return {"thread_id": "t", "agent_name": "exa", "user_query": "q", "result": "x" * result_chars, "source": []}
+
+async def test_small_payloads_stay_inline(tmp_path):
+    offloader = ResponseOffloader(LocalBlobStore(tmp_path), threshold_bytes=1024, codec="gzip")
+    payload = _payload(100)
+    assert await offloader.prepare("msg-1", payload) is payload
+    assert not any(tmp_path.iterdir())
+
+async def test_large_payload_round_trip(tmp_path):
+    offloader = ResponseOffloader(LocalBlobStore(tmp_path), threshold_bytes=1024, codec="gzip", summary_chars=50)
+    payload = _payload(5000)
+
+    stored = await offloader.prepare("msg-1", payload)
+    assert stored["offloaded"] is True
+    assert stored["result"] == "x" * 50
+    assert stored["result_truncated"] is True
+    assert stored["blob"]["codec"] == "gzip"
+    assert stored["blob"]["stored_size"] < stored["blob"]["size"]
+    assert await offloader.load(stored) == payload
+
+    await offloader.discard(stored)
+    with pytest.raises(FileNotFoundError):
+        await offloader.load(stored)
+
+async def test_inline_responses_load_as_is(tmp_path):
+    offloader = ResponseOffloader(LocalBlobStore(tmp_path), threshold_bytes=1024)
+    payload = _payload(10)
+    assert await offloader.load(payload) is payload
+    await offloader.discard(payload)
+
+async def test_zero_threshold_disables_offloading(tmp_path):
+    offloader = ResponseOffloader(LocalBlobStore(tmp_path), threshold_bytes=0)
+    payload = _payload(100000)
+    assert await offloader.prepare("msg-1", payload) is payload
+
+async def test_zstd_falls_back_to_gzip_without_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_store, "zstandard", None)
+    offloader = ResponseOffloader(LocalBlobStore(tmp_path), threshold_bytes=1024, codec="zstd")
+    assert offloader.codec == "gzip"
+    stored = await offloader.prepare("msg-1", _payload(5000))
+    assert stored["blob"]["codec"] == "gzip"
+    assert await offloader.load(stored) == _payload(5000)
+
+def test_non_text_results_are_flagged_truncated(tmp_path):
+    offloader = ResponseOffloader(LocalBlobStore(tmp_path))
+    summary = offloader._summary({"result": {"sections": []}})
+    assert summary["result"] is None
+    assert summary["result_truncated"] is True
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from semantic_cache import HashedNgramVectorizer, SemanticCache, VectorIndex
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+def test_paraphrases_score_above_unrelated_queries():
+    vectorizer = HashedNgramVectorizer(256)
+    query = vectorizer.transform("Who is the CEO of Acme Corp?")
+    paraphrase = vectorizer.transform("who's the ceo of acme corp")
+    unrelated = vectorizer.transform("protein folding papers from 2023")
+
+    assert float(query @ paraphrase) > 0.9
+    assert float(query @ unrelated) < 0.3
+
+def test_index_overwrites_oldest_rows_at_capacity():
+    index = VectorIndex(dim=2, capacity=2)
+    index.add(np.array([1.0, 0.0], dtype=np.float32), "a")
+    index.add(np.array([0.0, 1.0], dtype=np.float32), "b")
+    index.add(np.array([1.0, 0.0], dtype=np.float32), "c")
+
+    assert len(index) == 2
+    assert [entry for _, entry in index.search(np.array([1.0, 0.0], dtype=np.float32), 2)] == ["c", "b"]
+
+async def _cache_with(db, **entry):
+    cache = SemanticCache(db, threshold=0.9)
+    await db.chat_history.insert_one({"id": "msg-1", "response": {"result": "Jane Doe"}})
+    cache.add(**{
+        "message_id": "msg-1", "query": "Who is the CEO of Acme Corp?", "agent_name": "smart_router",
+        "user_id": "user-1", "personalized": False, "timestamp": datetime.now(timezone.utc), **entry,
+    })
+    return cache
+
+async def test_near_duplicate_is_served_for_the_same_agent():
+    cache = await _cache_with(FakeDatabase())
+    response, similarity = await cache.lookup("who's the ceo of acme corp", "smart_router", "user-2")
+    assert response == {"result": "Jane Doe"}
+    assert similarity >= 0.9
+    assert await cache.lookup("who's the ceo of acme corp", "normal_search", "user-2") is None
+
+async def test_personalized_answers_stay_with_their_user():
+    cache = await _cache_with(FakeDatabase(), personalized=True)
+    assert await cache.lookup("who's the ceo of acme corp", "smart_router", "user-2") is None
+    assert await cache.lookup("who's the ceo of acme corp", "smart_router", "user-1") is not None
+    assert cache.candidates("who's the ceo of acme corp", "user-2") == []
+
+async def test_personalized_requests_only_reuse_the_users_personalized_answers():
+    shared = await _cache_with(FakeDatabase())
+    assert await shared.lookup("who's the ceo of acme corp", "smart_router", "user-1", personalized=True) is None
+
+    own = await _cache_with(FakeDatabase(), personalized=True)
+    assert await own.lookup("who's the ceo of acme corp", "smart_router", "user-1", personalized=True) is not None
+    assert await own.lookup("who's the ceo of acme corp", "smart_router", "user-2", personalized=True) is None
+
+async def test_candidates_hide_other_users_queries():
+    cache = await _cache_with(FakeDatabase())
+    [own] = cache.candidates("who's the ceo of acme corp", "user-1")
+    [other] = cache.candidates("who's the ceo of acme corp", "user-2")
+    assert own["query"] == "Who is the CEO of Acme Corp?"
+    assert other["query"] is None
+    assert "message_id" not in other
+
+async def test_old_answers_are_not_served():
+    cache = await _cache_with(FakeDatabase(), timestamp=datetime.now(timezone.utc) - timedelta(days=2))
+    assert await cache.lookup("who's the ceo of acme corp", "smart_router", "user-1") is None
+
+class AggregateRecorder:
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipeline = None
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipeline = pipeline
+        recorder = self
+
+        class Cursor:
+            async def to_list(self, length):
+                return recorder.docs
+
+        return Cursor()
+
+async def test_load_only_indexes_conversations_with_a_requested_agent():
+    chat_history = AggregateRecorder([{
+        "_id": {"thread_id": "t", "user_id": "user-1"}, "id": "msg-1", "query": "acme revenue",
+        "agent_name": "smart_router", "personalized": True, "timestamp": "2026-10-01T00:00:00+00:00",
+    }])
+    db = type("Db", (), {"chat_history": chat_history})()
+    cache = SemanticCache(db)
+
+    assert await cache.load() == 1
+    group = next(stage["$group"] for stage in chat_history.pipeline if "$group" in stage)
+    assert group["agent_name"] == {"$first": "$requested_agent"}
+    # Legacy opening messages (no requested_agent) are dropped after grouping
+    assert {"$match": {"agent_name": {"$ne": None}}} in chat_history.pipeline
+    assert cache.candidates("acme revenue", "user-2") == []
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test")
+
+import server  # noqa: E402
+
+pytestmark = pytest.mark.anyio
+
+async def test_jobs_and_pollers_stop_before_http_clients_close(monkeypatch):
+    calls = []
+
+    def recorder(name):
+        async def stop():
+            calls.append(name)
+        return stop
+
+    monkeypatch.setattr(server.chat_jobs, "shutdown", recorder("chat_jobs"))
+    monkeypatch.setattr(server.state_broadcaster, "shutdown", recorder("state_broadcaster"))
+    monkeypatch.setattr(server.chat_admission, "stop", recorder("chat_admission"))
+    monkeypatch.setattr(server.orchestrator, "shutdown", recorder("orchestrator"))
+    monkeypatch.setattr(server.auth_client, "shutdown", recorder("auth_client"))
+    monkeypatch.setattr(server.agent_catalog, "stop", recorder("agent_catalog"))
+    monkeypatch.setattr(server.semantic_cache, "stop", recorder("semantic_cache"))
+    monkeypatch.setattr(server.write_buffer, "stop", recorder("write_buffer"))
+    monkeypatch.setattr(server, "client", type("Client", (), {"close": lambda self: calls.append("mongo")})())
+
+    for hook in server.app.router.on_shutdown:
+        await hook()
+
+    assert calls.index("chat_jobs") < calls.index("orchestrator")
+    assert calls.index("state_broadcaster") < calls.index("orchestrator")
+    assert calls.index("chat_jobs") < calls.index("auth_client")
+    assert calls[-2:] == ["write_buffer", "mongo"]
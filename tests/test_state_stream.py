@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+from state_stream import StateBroadcaster
+
+pytestmark = pytest.mark.anyio
+
+def _state(output=None, steps=(), status=None):
+    payload = {"thinking_steps": list(steps), "state": {"channels": {"output": output} if output else {}}}
+    if status:
+        payload["status"] = status
+    return payload
+
+async def _collect(broadcaster, thread_id, limit=2.0):
+    events = []
+
+    async def read():
+        async for frame in broadcaster.subscribe(thread_id):
+            if frame.startswith("event:"):
+                lines = frame.strip().split("\n")
+                events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+
+    await asyncio.wait_for(read(), timeout=limit)
+    return events
+
+async def test_follow_up_turn_waits_for_new_output():
+    polls = [
+        _state(output="old answer", steps=["s1"], status="completed"),
+        _state(output="old answer", steps=["s1", "s2"], status="completed"),
+        _state(output="new answer", steps=["s1", "s2", "s3"], status="completed"),
+    ]
+
+    async def fetch(_):
+        return polls.pop(0) if len(polls) > 1 else polls[0]
+
+    events = await _collect(StateBroadcaster(fetch, interval=0.01), "t")
+
+    deltas = [data for event, data in events if event == "delta"]
+    assert all(delta.get("output") != "old answer" for delta in deltas)
+    assert deltas[-1]["output"] == "new answer"
+    assert [step for delta in deltas for step in delta.get("thinking_steps", [])] == ["s1", "s2", "s3"]
+    assert events[-1][0] == "done"
+
+async def test_run_finishing_without_output_change_ends_stream():
+    polls = [_state(status="completed"), _state(status="running"), _state(status="completed")]
+
+    async def fetch(_):
+        return polls.pop(0) if len(polls) > 1 else polls[0]
+
+    events = await _collect(StateBroadcaster(fetch, interval=0.01), "t")
+    assert events[-1] == ("done", {"thread_id": "t"})
+
+async def test_first_turn_ends_when_output_appears():
+    polls = [_state(steps=["s1"], status="running"), _state(output="answer", steps=["s1"], status="running")]
+
+    async def fetch(_):
+        return polls.pop(0) if len(polls) > 1 else polls[0]
+
+    events = await _collect(StateBroadcaster(fetch, interval=0.01), "t")
+    assert any(data.get("output") == "answer" for event, data in events if event == "delta")
+    assert events[-1][0] == "done"
+
+async def test_thread_already_finished_and_unchanged_ends_after_idle_polls():
+    fetches = []
+
+    async def fetch(_):
+        fetches.append(1)
+        return _state(output="old answer", steps=["s1"], status="completed")
+
+    events = await _collect(StateBroadcaster(fetch, interval=0.01, idle_polls=3), "t")
+    assert events == [("delta", {"thinking_steps": ["s1"], "status": "completed"}), ("done", {"thread_id": "t", "reason": "idle"})]
+    assert len(fetches) == 4
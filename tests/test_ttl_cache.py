@@ -0,0 +1,38 @@
+from ttl_cache import TTLCache
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("ttl_cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("session", "user-1")
+    cache.set("short", "user-2", ttl=5)
+
+    now[0] += 10
+    assert cache.get("session") == "user-1"
+    assert cache.get("short") is None
+
+    now[0] += 60
+    assert cache.get("session") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_non_positive_ttl_is_not_stored():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("expired-session", "user-1", ttl=0)
+    assert len(cache) == 0
+
+def test_pop_evicts():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("token", "user-1")
+    assert cache.pop("token") == "user-1"
+    assert cache.get("token") is None
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from write_behind import MODE_ACK, WriteBehindBuffer
+
+pytestmark = pytest.mark.anyio
+
+class RecordingCollection:
+    def __init__(self, fail_with=None) -> None:
+        self.batches = []
+        self.fail_with = list(fail_with or [])
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        self.batches.append(list(operations))
+
+class RecordingDatabase:
+    def __init__(self, **collections) -> None:
+        self.collections = collections
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, RecordingCollection())
+
+async def test_writes_are_batched_per_collection():
+    db = RecordingDatabase()
+    buffer = WriteBehindBuffer(db, batch_size=100, flush_interval=0.05)
+    for i in range(3):
+        await buffer.insert("chat_history", {"id": i})
+    await buffer.update("threads", {"thread_id": "t"}, {"$set": {"title": "x"}}, upsert=True)
+    await asyncio.sleep(0.1)
+
+    assert [len(batch) for batch in db["chat_history"].batches] == [3]
+    assert [len(batch) for batch in db["threads"].batches] == [1]
+    await buffer.stop()
+
+async def test_stop_flushes_pending_writes():
+    db = RecordingDatabase()
+    buffer = WriteBehindBuffer(db, batch_size=100, flush_interval=60)
+    await buffer.insert("analytics", {"id": 1})
+    await buffer.insert("analytics", {"id": 2})
+    await buffer.stop()
+
+    assert sum(len(batch) for batch in db["analytics"].batches) == 2
+    assert buffer.pending == 0
+
+async def test_ack_mode_writes_before_returning():
+    db = RecordingDatabase()
+    buffer = WriteBehindBuffer(db, mode=MODE_ACK)
+    await buffer.insert("chat_history", {"id": 1})
+    assert len(db["chat_history"].batches) == 1
+
+async def test_failing_write_is_dropped_and_the_rest_retried():
+    error = BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "duplicate key"}]})
+    collection = RecordingCollection(fail_with=[error])
+    buffer = WriteBehindBuffer(RecordingDatabase(chat_history=collection))
+
+    await buffer._flush([("chat_history", InsertOne({"id": i})) for i in range(4)])
+
+    assert [op._doc["id"] for op in collection.batches[0]] == [2, 3]
+
+async def test_transient_errors_are_retried(monkeypatch):
+    async def no_sleep(_):
+        return None
+
+    monkeypatch.setattr("write_behind.asyncio.sleep", no_sleep)
+    collection = RecordingCollection(fail_with=[ConnectionError("reset")])
+    buffer = WriteBehindBuffer(RecordingDatabase(chat_history=collection))
+
+    await buffer._flush([("chat_history", InsertOne({"id": 1}))])
+    assert len(collection.batches) == 1